@@ -0,0 +1,120 @@
+"""Compare a cold ``promptpack pack`` run with requests to a warm ``promptpack serve``.
+
+On a ``synth.py`` project, times:
+
+- the CLI with an empty index cache, and again once the index exists (each
+  run still pays interpreter start-up, settings load, the scan and cold
+  reads);
+- ``pack``, ``preview`` and ``count_tokens`` requests to a server over
+  stdin/stdout, after a first request has warmed it;
+- a warm ``pack`` right after a file was added, which waits for the poll to
+  notice and rescans the changed folder.
+
+    python benchmarks/bench_daemon.py --profile small --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from synth import PROFILES, generate_project  # noqa: E402
+
+POLL = 0.05
+
+
+class Client:
+    """Talks JSON-RPC to a ``promptpack serve`` child process over its stdin/stdout."""
+
+    def __init__(self, env, settings):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "promptpack", "serve", "--settings", str(settings), "--poll", str(POLL)],
+            cwd=ROOT, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+        self.next_id = 0
+
+    def call(self, method, **params):
+        self.next_id += 1
+        request = {"jsonrpc": "2.0", "id": self.next_id, "method": method, "params": params}
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        response = json.loads(self.process.stdout.readline())
+        if "error" in response:
+            raise RuntimeError(response["error"]["message"])
+        return response["result"]
+
+    def close(self):
+        self.call("shutdown")
+        self.process.wait()
+
+
+def median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        folder = tmp / "project"
+        dest = tmp / "out"
+        dest.mkdir()
+        summary = generate_project(folder, seed=args.seed, **PROFILES[args.profile])
+        settings = tmp / "settings.json"
+        env = dict(os.environ, PROMPTPACK_CACHE_DIR=str(tmp / "cache"))
+        cli = [sys.executable, "-m", "promptpack", "pack", str(folder), "-o", str(dest), "--settings", str(settings)]
+
+        def run_cli():
+            subprocess.run(cli, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        print(f"project: {summary['files']} files, {summary['bytes'] / 1e6:.1f} MB")
+        print(f"cli pack, no index       : {median_ms(run_cli, 1):8.1f} ms")
+        print(f"cli pack, index built    : {median_ms(run_cli, args.repeat):8.1f} ms")
+
+        client = Client(env, settings)
+        try:
+            print(f"serve, first pack        : {median_ms(lambda: client.call('pack', src=str(folder), output=str(dest)), 1):8.1f} ms")
+            for method, params in (
+                ("pack", {"output": str(dest)}),
+                ("preview", {}),
+                ("count_tokens", {}),
+            ):
+                elapsed = median_ms(lambda: client.call(method, src=str(folder), **params), args.repeat)
+                print(f"serve, warm {method:<13}: {elapsed:8.1f} ms")
+
+            added = iter(range(args.repeat))
+
+            def pack_after_change():
+                (folder / f"added_{next(added)}.py").write_text("print('new')\n", encoding="utf-8")
+                time.sleep(POLL * 3)
+                start = time.perf_counter()
+                client.call("pack", src=str(folder), output=str(dest))
+                return time.perf_counter() - start
+
+            changed = statistics.median(pack_after_change() for _ in range(args.repeat)) * 1000
+            print(f"serve, pack after change : {changed:8.1f} ms")
+            status = client.call("status")
+            print(f"rescans: {status['projects'][0]['scans']}, content cache hits: {status['content_cache']['hits']}")
+        finally:
+            client.close()
+
+
+if __name__ == "__main__":
+    main()
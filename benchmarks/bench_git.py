@@ -0,0 +1,172 @@
+"""Time delta packing against a full pack on a synthetic git repository.
+
+First checks the git selection on a small repository: modified, renamed,
+deleted and untracked files below a subfolder, an export with
+``--git-target``, a bad ref and a folder outside any repository. Then commits a ``synth.py`` project, changes a few percent of its files in a
+second commit, then compares:
+
+- a full pack of the working tree with a ``--git-base`` delta pack;
+- reading the changed blobs through one ``git cat-file --batch`` process
+  with starting one ``git show`` per file.
+
+    python benchmarks/bench_git.py --profile small --changed 0.05
+"""
+import argparse
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synth import PROFILES, generate_project  # noqa: E402
+
+from promptpack.git import BlobReader, GitError, git_selection, tracked_selection  # noqa: E402
+from promptpack.settings import DEFAULT_SETTINGS  # noqa: E402
+from promptpack.utils import content_cache, default_selected_files, file_limits, generate_output  # noqa: E402
+
+
+def git(folder, *args):
+    subprocess.run(
+        ["git", "-C", str(folder), "-c", "user.email=bench@example.com", "-c", "user.name=bench", *args],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+def expect_git_error(func):
+    try:
+        func()
+    except GitError:
+        return
+    raise AssertionError("expected a GitError")
+
+
+def check_selection(tmp: Path, settings):
+    repo = tmp / "repo"
+    src = repo / "src"
+    src.mkdir(parents=True)
+    files = {
+        "src/app.py": "app = 1\n",
+        "src/old.py": "old = 1\n",
+        "src/moved.py": "moved = 1\n",
+        "src/with space.py": "space = 1\n",
+        "src/notes.txt": "not selected\n",
+        "lib/other.py": "other = 1\n",
+    }
+    for rel, text in files.items():
+        (repo / rel).parent.mkdir(parents=True, exist_ok=True)
+        (repo / rel).write_text(text, encoding="utf-8")
+    git(repo, "init", "-q")
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "base")
+    git(repo, "tag", "base")
+
+    assert tracked_selection(src, settings) == ["app.py", "moved.py", "old.py", "with space.py"]
+
+    (src / "app.py").write_text("app = 2\n", encoding="utf-8")
+    (repo / "lib" / "other.py").write_text("other = 2\n", encoding="utf-8")
+    git(repo, "mv", "src/moved.py", "src/renamed.py")
+    git(repo, "rm", "-q", "src/old.py")
+    (src / "new.py").write_text("new = 1\n", encoding="utf-8")
+
+    root, changed, deleted = git_selection(src, settings, "base")
+    assert root == src
+    assert changed == [src / "app.py", src / "new.py", src / "renamed.py"], changed
+    assert deleted == ["moved.py", "old.py"], deleted
+
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", "target")
+    git(repo, "tag", "target")
+    # Working tree edits after the target must not reach the export.
+    (src / "app.py").write_text("app = 3\n", encoding="utf-8")
+    root, exported, deleted = git_selection(src, settings, "base", "target")
+    try:
+        assert root != src and root.name == "src"
+        assert exported == [root / "app.py", root / "new.py", root / "renamed.py"], exported
+        assert (root / "app.py").read_text(encoding="utf-8") == "app = 2\n"
+        assert deleted == ["moved.py", "old.py"], deleted
+    finally:
+        shutil.rmtree(root.parent)
+
+    with BlobReader(repo) as reader:
+        assert reader.read("target:./src/no such.py") is None
+        assert reader.read("target:./src") is None
+        assert reader.read("base:./src/with space.py") == b"space = 1\n"
+
+    expect_git_error(lambda: git_selection(src, settings, "no-such-ref"))
+    outside = tmp / "outside"
+    outside.mkdir()
+    expect_git_error(lambda: git_selection(outside, settings))
+    expect_git_error(lambda: tracked_selection(outside, settings))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--changed", type=float, default=0.05, help="share of files changed in the second commit")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    settings = dict(DEFAULT_SETTINGS)
+    content_cache.set_limits(file_limits(settings))
+    with tempfile.TemporaryDirectory() as tmp:
+        check_selection(Path(tmp) / "check", settings)
+        print("git selection checks passed")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp) / "project"
+        dest = Path(tmp) / "out"
+        dest.mkdir()
+        generate_project(folder, seed=args.seed, **PROFILES[args.profile])
+        git(folder, "init", "-q")
+        git(folder, "add", "-A")
+        git(folder, "commit", "-q", "-m", "base")
+        git(folder, "tag", "base")
+
+        files = sorted(default_selected_files(folder, settings))
+        rng = random.Random(args.seed)
+        for path in rng.sample(files, max(1, int(len(files) * args.changed))):
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n# changed\n")
+        git(folder, "commit", "-q", "-a", "-m", "change")
+
+        def pack(paths):
+            content_cache.clear()
+            return generate_output(str(folder), str(dest), paths, True, True, True, workers=settings["read_workers"])
+
+        full_time, _ = timed(lambda: pack(sorted(default_selected_files(folder, settings))))
+        delta_time, (_, changed, _) = timed(lambda: git_selection(folder, settings, "base"))
+        delta_time += timed(lambda: pack(changed))[0]
+        print(f"full pack        : {full_time * 1000:8.1f} ms ({len(files)} files)")
+        print(f"delta pack       : {delta_time * 1000:8.1f} ms ({len(changed)} files)")
+
+        rels = [path.relative_to(folder).as_posix() for path in changed]
+
+        def batched():
+            with BlobReader(folder) as reader:
+                return [reader.read(f"HEAD:./{rel}") for rel in rels]
+
+        def per_file():
+            return [
+                subprocess.run(["git", "-C", str(folder), "show", f"HEAD:./{rel}"], check=True, capture_output=True).stdout
+                for rel in rels
+            ]
+
+        batch_time, batch_blobs = timed(batched)
+        show_time, show_blobs = timed(per_file)
+        assert batch_blobs == show_blobs, "cat-file and show disagree"
+        print(f"cat-file --batch : {batch_time * 1000:8.1f} ms ({len(rels)} blobs)")
+        print(f"git show per file: {show_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Measure start-up cost of the library import and of the headless CLI.
+
+Every sample runs in a fresh interpreter, and each one also checks that
+neither path loads tkinter or markdown::
+
+    python benchmarks/bench_import.py --repeat 20
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHECK_GUI_FREE = (
+    "import sys; "
+    "loaded = [m for m in ('tkinter', 'markdown') if m in sys.modules]; "
+    "assert not loaded, loaded"
+)
+
+
+def sample(cmd, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "src"
+        src.mkdir()
+        (src / "main.py").write_text("print('hello')\n", encoding="utf-8")
+
+        cases = [
+            ("bare interpreter", [sys.executable, "-c", "pass"]),
+            ("import promptpack", [sys.executable, "-c", f"import promptpack; {CHECK_GUI_FREE}"]),
+            ("library generate_output", [sys.executable, "-c", f"from promptpack import generate_output; {CHECK_GUI_FREE}"]),
+            ("cli pack", [sys.executable, "-m", "promptpack", "pack", str(src), "-o", tmp]),
+        ]
+        for label, cmd in cases:
+            print(f"{label:<24} {sample(cmd, args.repeat) * 1000:7.1f} ms")
+
+        cli_check = f"from promptpack.cli import main; main(['pack', {str(src)!r}, '-o', {tmp!r}]); {CHECK_GUI_FREE}"
+        subprocess.run([sys.executable, "-c", cli_check], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        print("tkinter and markdown were not imported on either path")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare a full walk with cold and warm scans of the persistent index.
+
+Each scan is timed as the file selector uses it: the default selection is
+listed and loaded into a :class:`SelectionModel`.
+
+    python benchmarks/bench_index.py --files 100000
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from promptpack.index import ProjectIndex  # noqa: E402
+from promptpack.selection import SelectionModel  # noqa: E402
+from promptpack.settings import DEFAULT_SETTINGS  # noqa: E402
+from promptpack.utils import default_selected_names  # noqa: E402
+
+
+def build_tree(root: Path, files: int, per_dir: int):
+    for i in range(files):
+        folder = root / f"pkg{i // (per_dir * 20)}" / f"mod{(i // per_dir) % 20}"
+        if i % per_dir == 0:
+            folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"file{i}.py").write_bytes(b"")
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--per-dir", type=int, default=50, help="files per folder")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "project"
+        build_tree(root, args.files, args.per_dir)
+        cache = Path(tmp) / "cache"
+
+        def walk():
+            names = default_selected_names(root, DEFAULT_SETTINGS)
+            SelectionModel(root, names)
+            return set(names)
+
+        walk_time, walked = timed(walk)
+        print(f"full walk        : {walk_time * 1000:8.1f} ms ({len(walked)} files)")
+
+        def reopen():
+            index = ProjectIndex(root, DEFAULT_SETTINGS, cache)
+            names = index.scan()
+            SelectionModel(root, names)
+            index.close()
+            return index, set(names)
+
+        cold_time, (index, cold) = timed(reopen)
+        print(f"index, cold      : {cold_time * 1000:8.1f} ms ({index.dirs_rescanned} folders listed)")
+
+        warm_time, (index, warm) = timed(reopen)
+        print(f"index, reopened  : {warm_time * 1000:8.1f} ms ({index.dirs_rescanned} folders listed)")
+
+        (root / "pkg0" / "mod0" / "added.py").write_bytes(b"")
+        touched_time, (index, touched) = timed(reopen)
+        print(f"index, one change: {touched_time * 1000:8.1f} ms ({index.dirs_rescanned} folders listed)")
+
+        assert walked == cold == warm == touched - {"pkg0/mod0/added.py"}
+
+
+if __name__ == "__main__":
+    main()
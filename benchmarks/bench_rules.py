@@ -0,0 +1,96 @@
+"""Compare the compiled selection rules against per-rule checks as rules grow.
+
+Filters a synthetic list of relative paths with the old approach (a set
+lookup for names plus ``any(excl in parts ...)`` per excluded folder, and
+``fnmatch`` per pattern) and with :class:`SelectionRules`::
+
+    python benchmarks/bench_rules.py --paths 100000 --rules 10 100 1000
+"""
+import argparse
+import fnmatch
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from promptpack.rules import SelectionRules  # noqa: E402
+
+
+def make_paths(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    exts = [".py", ".js", ".ts", ".css", ".md", ".min.js", ".log"]
+    paths = []
+    for i in range(count):
+        depth = rng.randint(0, 5)
+        folders = [f"dir{rng.randint(0, 30)}" for _ in range(depth)]
+        paths.append("/".join(folders + [f"file{i}{rng.choice(exts)}"]))
+    return paths
+
+
+def make_rules(count: int):
+    # Half plain folder names, a quarter plain file names, a quarter globs.
+    dirs = [f"excluded{i}" for i in range(count // 2)] + ["dir7"]
+    files = [f"name{i}.py" for i in range(count // 4)]
+    globs = [f"*.gen{i}.js" for i in range(count - count // 2 - count // 4)] + ["*.min.js"]
+    return dirs, files + globs
+
+
+def select_naive(paths, allowed, dirs, files):
+    literal = {f for f in files if "*" not in f}
+    globs = [f for f in files if "*" in f]
+    selected = []
+    for path in paths:
+        parts = path.split("/")
+        name = parts[-1]
+        if Path(name).suffix not in allowed or name in literal:
+            continue
+        if any(excl in parts[:-1] for excl in dirs):
+            continue
+        if any(fnmatch.fnmatch(name, g) for g in globs):
+            continue
+        selected.append(path)
+    return selected
+
+
+def select_compiled(paths, allowed, dirs, files):
+    rules = SelectionRules({"allowed_exts": allowed, "excluded_dirs": dirs, "excluded_files": files})
+    scope = rules.scope("")
+    selected = []
+    for path in paths:
+        parts = path.split("/")
+        # A walk prunes once per folder; here every ancestor is checked per path.
+        if any(rules.prunes(scope, "", part) for part in parts[:-1]):
+            continue
+        folder, _, name = path.rpartition("/")
+        if rules.selects(scope, folder, name):
+            selected.append(path)
+    return selected
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", type=int, default=100_000)
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    paths = make_paths(args.paths)
+    allowed = [".py", ".js", ".ts", ".css"]
+    for count in args.rules:
+        dirs, files = make_rules(count)
+        naive_time, naive = timed(select_naive, paths, allowed, dirs, files)
+        compiled_time, compiled = timed(select_compiled, paths, allowed, dirs, files)
+        assert naive == compiled, "the two filters disagree"
+        print(f"{count:5} rules: per-rule {naive_time * 1000:8.1f} ms   compiled {compiled_time * 1000:8.1f} ms"
+              f"   ({len(compiled)} of {len(paths)} selected)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Time the main scan, preview and pack paths on a synthetic project.
+
+The project comes from ``synth.py``. The GUI methods run on a
+``PromptPackApp`` that has no window: its Tk variables live on a bare
+``tkinter.Tcl()`` interpreter, so no display is needed. Results are written
+as JSON and compared with a stored baseline; the exit status is 1 when a
+case got slower than ``--tolerance`` times its baseline. Timings only
+compare on the same machine, so record a baseline there first::
+
+    python benchmarks/bench_suite.py --profile small --output results.json
+    python benchmarks/bench_suite.py --profile small --save-baseline
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tkinter as tk
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synth import PROFILES, generate_project  # noqa: E402
+
+from promptpack.gui import PromptPackApp  # noqa: E402
+from promptpack.index import scan_project  # noqa: E402
+from promptpack.render import render_cache  # noqa: E402
+from promptpack.selection import SelectionModel  # noqa: E402
+from promptpack.settings import DEFAULT_SETTINGS  # noqa: E402
+from promptpack.tokenizer import TokenCounter  # noqa: E402
+from promptpack.utils import (  # noqa: E402
+    content_cache,
+    estimate_token_count,
+    file_limits,
+    generate_output,
+    iter_file_texts,
+)
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# Cases faster than this are too noisy to flag as regressions.
+MIN_COMPARED_SECONDS = 0.005
+
+
+def headless_app(folder: Path, settings):
+    """A ``PromptPackApp`` without widgets, enough for the non-interactive methods."""
+    root = tk.Tcl()
+    app = PromptPackApp.__new__(PromptPackApp)
+    app.root = root
+    app.settings = settings
+    app.token_counter = TokenCounter()
+    app.as_markdown = tk.BooleanVar(root, settings["as_markdown"])
+    app.include_heading = tk.BooleanVar(root, settings["include_heading"])
+    app.use_code_block = tk.BooleanVar(root, settings["use_code_block"])
+    app.dedupe = tk.BooleanVar(root, settings["dedupe"])
+    app.start_folder = tk.StringVar(root, str(folder))
+    app.selected_files = set()
+    app.selection_root = None
+    return app
+
+
+def clear_caches(app):
+    content_cache.clear()
+    render_cache.clear()
+    app.token_counter = TokenCounter()
+
+
+def measure(func, repeat: int, setup=None):
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "runs": repeat}, result
+
+
+def run_suite(folder: Path, dest: Path, repeat: int):
+    settings = dict(DEFAULT_SETTINGS, use_index=False)
+    content_cache.set_limits(file_limits(settings))
+    app = headless_app(folder, settings)
+    results = {}
+
+    def cold():
+        clear_caches(app)
+
+    def scan():
+        _, names = scan_project(folder, settings)
+        return SelectionModel(folder, names)
+
+    results["scan"], selection = measure(scan, repeat)
+    files = sorted(selection)
+    options = app.preview_options()
+
+    def preview():
+        return app.build_preview_segments(files, options, settings["read_workers"], settings["dedupe"])
+
+    results["preview_cold"], _ = measure(preview, repeat, cold)
+    results["preview_warm"], _ = measure(preview, repeat)
+    text = "".join(app.format_preview_segment(path, content, options) for path, content in iter_file_texts(files))
+    results["estimate_token_count"], _ = measure(lambda: estimate_token_count(text), repeat)
+
+    def pack():
+        return generate_output(
+            str(folder), str(dest), files, True, True, True, workers=settings["read_workers"],
+        )
+
+    results["generate_output_cold"], _ = measure(pack, repeat, cold)
+    results["generate_output_warm"], _ = measure(pack, repeat)
+
+    def render():
+        return app.write_preview_html(files, options, "dark")
+
+    results["render_html_cold"], _ = measure(render, repeat, cold)
+    results["render_html_warm"], _ = measure(render, repeat)
+    return results, {"selected_files": len(files), "preview_chars": len(text)}
+
+
+def compare(results, baseline, tolerance: float) -> bool:
+    ok = True
+    print(f"{'case':24} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for name, current in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:24} {'-':>10} {current['min'] * 1000:8.1f}ms")
+            continue
+        ratio = current["min"] / base["min"] if base["min"] else float("inf")
+        slower = ratio > tolerance and current["min"] > MIN_COMPARED_SECONDS
+        ok = ok and not slower
+        flag = "  SLOWER" if slower else ""
+        print(f"{name:24} {base['min'] * 1000:8.1f}ms {current['min'] * 1000:8.1f}ms {ratio:6.2f}x{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=str(BASELINE), help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown before a case fails")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The HTML preview goes to a new temporary folder on every render.
+        tempfile.tempdir = tmp
+        folder = Path(tmp) / "project"
+        dest = Path(tmp) / "out"
+        dest.mkdir()
+        project = generate_project(folder, seed=args.seed, **PROFILES[args.profile])
+        results, counts = run_suite(folder, dest, args.repeat)
+        tempfile.tempdir = None
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "profile": args.profile,
+            "seed": args.seed,
+            "project": project,
+            **counts,
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    baseline_path = Path(args.baseline)
+    if not baseline_path.exists():
+        for name, current in results.items():
+            print(f"{name:24} {current['min'] * 1000:8.1f}ms")
+        return 0
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if baseline["meta"].get("profile") != args.profile:
+        print(f"warning: baseline was recorded with the {baseline['meta'].get('profile')!r} profile")
+    return 0 if compare(results, baseline, args.tolerance) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Time preview window loads and toggles as the number of files grows.
+
+Builds a :class:`PreviewDocument` over synthetic segments and measures a
+jump to a random line (one window of ``WINDOW_LINES`` lines), patching one
+file in or out, and the characters held by the segment cache::
+
+    python benchmarks/bench_viewer.py --files 1000 10000 100000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from promptpack.viewer import WINDOW_LINES, PreviewDocument  # noqa: E402
+
+
+def make_segment(index: int, lines: int) -> str:
+    return "\n".join(f"file{index}.py line {n}: " + "x" * 40 for n in range(lines))
+
+
+def run(count: int, jumps: int, seed: int = 0):
+    rng = random.Random(seed)
+    sizes = [rng.randint(5, 400) for _ in range(count)]
+    doc = PreviewDocument(lambda i: make_segment(i, sizes[i]))
+    doc.set_header("Tokens: 0\n" + "=" * 40 + "\nProject: bench\n")
+    doc.reset(range(count), sizes)
+
+    start = time.perf_counter()
+    for _ in range(jumps):
+        doc.lines(rng.randrange(doc.total_lines), WINDOW_LINES)
+    jump = (time.perf_counter() - start) / jumps
+
+    start = time.perf_counter()
+    for _ in range(jumps):
+        pos = rng.randrange(len(doc.paths))
+        path = doc.paths[pos]
+        doc.remove(pos)
+        doc.insert(pos, path, sizes[path])
+        doc.lines(doc.segment_start(pos), WINDOW_LINES)
+    toggle = (time.perf_counter() - start) / jumps
+    return doc.total_lines, jump, toggle, doc._cached_chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--jumps", type=int, default=200)
+    args = parser.parse_args()
+
+    for count in args.files:
+        lines, jump, toggle, cached = run(count, args.jumps)
+        print(f"{count:7} files ({lines:9} lines): jump {jump * 1000:6.2f} ms   "
+              f"toggle + reload {toggle * 1000:6.2f} ms   cache {cached / 1e6:5.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
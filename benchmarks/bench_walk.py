@@ -0,0 +1,79 @@
+"""Compare the pruning walker against the old ``rglob`` + filter approach.
+
+Builds a synthetic project whose ``node_modules`` folder dwarfs the actual
+sources, then times both strategies on it::
+
+    python benchmarks/bench_walk.py --packages 2000 --files-per-package 20
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from promptpack.settings import DEFAULT_SETTINGS  # noqa: E402
+from promptpack.utils import default_selected_files  # noqa: E402
+
+
+def build_tree(root: Path, src_files: int, packages: int, files_per_package: int):
+    src = root / "src"
+    for i in range(src_files):
+        folder = src / f"module{i % 20}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"file{i}.py").write_text(f"value = {i}\n", encoding="utf-8")
+    for p in range(packages):
+        pkg = root / "node_modules" / f"package{p}" / "lib"
+        pkg.mkdir(parents=True, exist_ok=True)
+        for i in range(files_per_package):
+            (pkg / f"index{i}.js").write_text("module.exports = {};\n", encoding="utf-8")
+
+
+def select_rglob(folder: Path, settings):
+    return {
+        f
+        for f in folder.rglob("*")
+        if f.is_file()
+        and f.suffix in settings["allowed_exts"]
+        and f.name not in settings["excluded_files"]
+        and not any(excl in f.parts for excl in settings["excluded_dirs"])
+    }
+
+
+def timed(func, *args, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--src-files", type=int, default=500)
+    parser.add_argument("--packages", type=int, default=1000)
+    parser.add_argument("--files-per-package", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        build_tree(root, args.src_files, args.packages, args.files_per_package)
+        total = args.src_files + args.packages * args.files_per_package
+        print(f"Synthetic tree: {total} files ({args.packages * args.files_per_package} in node_modules)")
+
+        rglob_time, rglob_files = timed(select_rglob, root, DEFAULT_SETTINGS, repeat=args.repeat)
+        walk_time, walked = timed(default_selected_files, root, DEFAULT_SETTINGS, repeat=args.repeat)
+        assert rglob_files == walked, "walkers disagree on the selection"
+
+        print(f"rglob + filter : {rglob_time * 1000:8.1f} ms ({len(rglob_files)} files)")
+        print(f"walk_selected  : {walk_time * 1000:8.1f} ms ({len(walked)} files)")
+        print(f"speedup        : {rglob_time / walk_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
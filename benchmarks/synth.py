@@ -0,0 +1,131 @@
+"""Generate synthetic projects for the benchmarks.
+
+A project has source files spread over nested folders, with sizes drawn
+from a log-normal distribution, an excluded folder (``node_modules``) bloated
+with files that a good scan never visits, a share of binary noise (images
+and NUL-laden files with source extensions) and some byte-identical copies.
+Generation is seeded, so the same parameters always produce the same tree::
+
+    python benchmarks/synth.py /tmp/project --profile medium
+"""
+import argparse
+import json
+import math
+import random
+from pathlib import Path
+
+PROFILES = {
+    "small": {
+        "files": 500, "depth": 3, "median_size": 2048, "sigma": 1.0, "max_size": 256 * 1024,
+        "excluded_files": 2000, "binary_ratio": 0.02, "duplicate_ratio": 0.05,
+    },
+    "medium": {
+        "files": 5000, "depth": 4, "median_size": 3072, "sigma": 1.2, "max_size": 1024 * 1024,
+        "excluded_files": 20000, "binary_ratio": 0.02, "duplicate_ratio": 0.05,
+    },
+    "large": {
+        "files": 50000, "depth": 5, "median_size": 3072, "sigma": 1.2, "max_size": 4 * 1024 * 1024,
+        "excluded_files": 100000, "binary_ratio": 0.02, "duplicate_ratio": 0.05,
+    },
+}
+
+FILES_PER_FOLDER = 20
+
+# Most files use extensions selected by default; the rest are left out.
+EXTENSIONS = [".py"] * 4 + [".js"] * 3 + [".ts", ".html", ".css", ".php", ".md", ".txt"]
+
+LINES = {
+    ".py": ["def handler(request):\n", "    return {'status': 'ok', 'items': items}\n", "import os\n",
+            "class Model:\n", "    value = compute(a, b) + offset  # adjust\n", "\n"],
+    ".js": ["function handler(req, res) {\n", "  return res.json({ ok: true });\n", "}\n",
+            "const items = list.map((x) => x * 2);\n", "\n"],
+    ".ts": ["export interface Item { id: number; name: string }\n", "const x: number = 1;\n", "\n"],
+    ".html": ["<div class=\"row\">\n", "  <span>Item</span>\n", "</div>\n"],
+    ".css": [".row { display: flex; }\n", "  margin: 0 auto;\n", "}\n"],
+    ".php": ["<?php echo $value; ?>\n", "$items = array_map('trim', $list);\n", "\n"],
+    ".md": ["# Title\n", "Some text about the module.\n", "\n"],
+    ".txt": ["plain text line\n", "\n"],
+}
+
+
+def corpus(ext: str, rng: random.Random, size: int = 256 * 1024) -> str:
+    lines = LINES[ext]
+    parts = []
+    total = 0
+    while total < size:
+        line = rng.choice(lines)
+        parts.append(line)
+        total += len(line)
+    return "".join(parts)
+
+
+def folder_for(index: int, depth: int, fanout: int) -> Path:
+    leaf = index // FILES_PER_FOLDER
+    parts = []
+    for _ in range(depth):
+        parts.append(f"dir{leaf % fanout}")
+        leaf //= fanout
+    return Path(*reversed(parts))
+
+
+def generate_project(root, files: int = 500, depth: int = 3, median_size: int = 2048, sigma: float = 1.0,
+                     max_size: int = 256 * 1024, excluded_files: int = 2000, binary_ratio: float = 0.02,
+                     duplicate_ratio: float = 0.05, seed: int = 0) -> dict:
+    """Write a synthetic project under ``root`` and return a summary of what was written."""
+    root = Path(root)
+    rng = random.Random(seed)
+    corpora = {ext: corpus(ext, rng) for ext in LINES}
+    leaves = max(1, math.ceil(files / FILES_PER_FOLDER))
+    fanout = max(2, math.ceil(leaves ** (1 / depth))) if depth else 1
+    summary = {"files": 0, "bytes": 0, "binary": 0, "duplicates": 0, "excluded_files": 0}
+    written = []
+
+    for i in range(files):
+        folder = root / folder_for(i, depth, fanout)
+        folder.mkdir(parents=True, exist_ok=True)
+        ext = rng.choice(EXTENSIONS)
+        path = folder / f"file{i}{ext}"
+        roll = rng.random()
+        if roll < binary_ratio:
+            # Half are real images, half are binaries behind a source extension.
+            if rng.random() < 0.5:
+                path = path.with_suffix(".png")
+            data = bytes(rng.getrandbits(8) for _ in range(1024)) + b"\0" * 64
+            summary["binary"] += 1
+        elif roll < binary_ratio + duplicate_ratio and written:
+            source = rng.choice(written)
+            data = source.read_bytes()
+            path = path.with_suffix(source.suffix)
+            summary["duplicates"] += 1
+        else:
+            size = min(max_size, max(16, int(rng.lognormvariate(math.log(median_size), sigma))))
+            text = corpora[ext]
+            data = b""
+            while len(data) < size:
+                start = rng.randrange(len(text) // 2)
+                data += text[start:start + size - len(data)].encode("utf-8")
+            written.append(path)
+        path.write_bytes(data)
+        summary["files"] += 1
+        summary["bytes"] += len(data)
+
+    bloat = root / "node_modules"
+    for i in range(excluded_files):
+        folder = bloat / f"package{i // 50}" / "lib"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"index{i % 50}.js").write_text("module.exports = {};\n", encoding="utf-8")
+        summary["excluded_files"] += 1
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="folder to create the project in")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(generate_project(args.root, seed=args.seed, **PROFILES[args.profile]), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,16 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # promptpack/__init__.py resolves its public names with importlib, and
+    # markdown loads the extensions named in render.EXTENSIONS the same way.
+    hiddenimports=[
+        'promptpack.gui',
+        'promptpack.render',
+        'promptpack.settings',
+        'promptpack.utils',
+        'markdown.extensions.fenced_code',
+        'markdown.extensions.codehilite',
+    ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
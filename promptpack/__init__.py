@@ -1,6 +1,13 @@
-from .gui import PromptPackApp
-from .settings import load_settings, save_settings
-from .utils import generate_output
+import importlib
+
+# Public names are resolved on first access so that `import promptpack` stays
+# cheap and never pulls in tkinter or markdown unless the GUI is used.
+_LAZY_ATTRS = {
+    "PromptPackApp": ".gui",
+    "load_settings": ".settings",
+    "save_settings": ".settings",
+    "generate_output": ".utils",
+}
 
 __all__ = [
     "PromptPackApp",
@@ -9,3 +16,15 @@ __all__ = [
     "generate_output",
 ]
 
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,12 +1,20 @@
-import tkinter as tk
-from promptpack import PromptPackApp
+import sys
 
 
-def main():
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        from promptpack.cli import main as cli_main
+        return cli_main(argv)
+
+    import tkinter as tk
+    from promptpack import PromptPackApp
+
     root = tk.Tk()
     app = PromptPackApp(root)
     root.mainloop()
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
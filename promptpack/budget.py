@@ -0,0 +1,131 @@
+"""Fit a selection into a token budget.
+
+Costs are estimated from ``stat`` sizes first; only files that could still
+fit are read and tokenized, so packing a large tree into a small context
+window never reads the whole tree.
+"""
+import fnmatch
+import os
+from collections import namedtuple
+
+from .tokenizer import TokenCounter
+from .utils import (
+    SkippedFile,
+    check_cancel,
+    content_cache,
+    duplicate_block,
+    file_block_parts,
+    output_header,
+    output_variant,
+)
+
+# Files whose size-based estimate exceeds the remaining budget by more than
+# this factor are dropped without being read.
+ESTIMATE_SLACK = 2
+
+PRIORITY_RULES = ("glob:<pattern>", "recent", "oldest", "smaller", "larger")
+
+BudgetResult = namedtuple("BudgetResult", ["selected", "dropped", "tokens"])
+
+
+def priority_key(rules, start_folder):
+    """Build a sort key from priority rules, highest priority first.
+
+    Each rule adds one component to the key, so earlier rules dominate.
+    ``glob:<pattern>`` puts files whose relative path matches the pattern
+    first, ``recent``/``oldest`` order by modification time and
+    ``smaller``/``larger`` by size. The relative path breaks ties.
+    """
+    for rule in rules:
+        if not rule.startswith("glob:") and rule not in PRIORITY_RULES:
+            raise ValueError(f"Unknown priority rule: {rule!r} (expected one of {', '.join(PRIORITY_RULES)})")
+
+    def key(item):
+        path, st = item
+        rel = path.relative_to(start_folder).as_posix()
+        parts = []
+        for rule in rules:
+            if rule.startswith("glob:"):
+                parts.append(0 if fnmatch.fnmatch(rel, rule[len("glob:"):]) else 1)
+            elif rule == "recent":
+                parts.append(-st.st_mtime_ns)
+            elif rule == "oldest":
+                parts.append(st.st_mtime_ns)
+            elif rule == "smaller":
+                parts.append(st.st_size)
+            elif rule == "larger":
+                parts.append(-st.st_size)
+        parts.append(rel)
+        return parts
+
+    return key
+
+
+def fit_to_budget(start_folder, included_files, max_tokens: int, priorities=(), as_markdown: bool = True, include_heading: bool = True, use_code_block: bool = True, token_counter: TokenCounter = None, cancel=None, duplicates=None, cache=None):
+    """Choose the files of ``included_files`` that fit in ``max_tokens``.
+
+    Files are considered in ``priorities`` order (``("smaller",)`` when
+    empty) and added greedily while they fit. Token counts cover the file's
+    heading and fence as written by ``generate_output``. ``selected`` keeps
+    the order of ``included_files``; ``dropped`` lists ``(path, reason)``.
+
+    ``duplicates`` maps files to an earlier file with the same contents (see
+    :func:`promptpack.utils.find_duplicates`); such a file only costs its
+    short reference once the original has been chosen.
+    """
+    counter = token_counter or TokenCounter()
+    cache = cache or content_cache
+    priorities = list(priorities) or ["smaller"]
+    remaining = max_tokens - counter.count(output_header(start_folder))
+
+    candidates = []
+    dropped = []
+    for path in included_files:
+        try:
+            candidates.append((path, os.stat(path)))
+        except OSError as e:
+            dropped.append((path, f"unreadable: {e.strerror or e}"))
+    candidates.sort(key=priority_key(priorities, start_folder))
+
+    variant = output_variant(start_folder, as_markdown, include_heading, use_code_block)
+    limits = cache.limits
+    max_bytes = limits.max_bytes if limits is not None and limits.oversize == "truncate" else 0
+    chosen = set()
+    duplicates = duplicates or {}
+    for path, st in candidates:
+        check_cancel(cancel)
+        first = duplicates.get(path)
+        if first is not None and first in chosen:
+            tokens = counter.count(duplicate_block(start_folder, path, first, include_heading))
+            if tokens > remaining:
+                dropped.append((path, f"too large: {tokens} tokens, {max(remaining, 0)} left"))
+                continue
+            chosen.add(path)
+            remaining -= tokens
+            continue
+        estimate = (min(st.st_size, max_bytes) if max_bytes else st.st_size) // 4
+        if estimate > remaining * ESTIMATE_SLACK:
+            dropped.append((path, f"too large: ~{estimate} tokens estimated, {max(remaining, 0)} left"))
+            continue
+
+        def block(path=path):
+            prefix, suffix = file_block_parts(start_folder, path, as_markdown, include_heading, use_code_block)
+            return prefix + cache.read_text(path) + suffix
+
+        try:
+            tokens = counter.count_file(path, block, variant, cache)
+        except SkippedFile:
+            # Left out of the output anyway; generate_output reports it.
+            chosen.add(path)
+            continue
+        except OSError as e:
+            dropped.append((path, f"unreadable: {e.strerror or e}"))
+            continue
+        if tokens > remaining:
+            dropped.append((path, f"too large: {tokens} tokens, {max(remaining, 0)} left"))
+            continue
+        chosen.add(path)
+        remaining -= tokens
+
+    selected = [p for p in included_files if p in chosen]
+    return BudgetResult(selected, dropped, max_tokens - remaining)
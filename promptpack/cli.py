@@ -0,0 +1,204 @@
+"""Headless command line interface.
+
+Only the standard library and the non-GUI modules are imported here, so the
+CLI starts quickly and works without a display::
+
+    python -m promptpack pack <src> -o <dest>
+"""
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+from .settings import SETTINGS_FILE, load_settings
+from .trace import tracer
+from .utils import ContentCache, file_limits, generate_output
+
+
+def split_list(value: str):
+    return [x.strip() for x in value.split(",") if x.strip()]
+
+
+def add_toggle(parser, name: str, dest: str, help_text: str):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(f"--{name}", dest=dest, action="store_true", default=None, help=help_text)
+    group.add_argument(f"--no-{name}", dest=dest, action="store_false", default=None)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="promptpack", description="Pack source files into a single Markdown or text file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pack = commands.add_parser("pack", help="pack a folder without opening the GUI")
+    pack.add_argument("src", help="source folder")
+    pack.add_argument("-o", "--output", default=".", help="destination folder (default: current directory)")
+    pack.add_argument("--settings", default=SETTINGS_FILE, help=f"settings file (default: {SETTINGS_FILE})")
+    pack.add_argument("--allowed-exts", type=split_list, help="comma separated extensions, e.g. .py,.js")
+    pack.add_argument("--excluded-dirs", type=split_list, help="comma separated folder patterns to skip, e.g. build,/docs,!keep/")
+    pack.add_argument("--excluded-files", type=split_list, help="comma separated file patterns to skip, e.g. *.min.js,!app.min.js")
+    add_toggle(pack, "gitignore", "use_gitignore", "also skip what the project's .gitignore files ignore")
+    add_toggle(pack, "markdown", "as_markdown", "write Markdown instead of plain text")
+    add_toggle(pack, "heading", "include_heading", "add a heading with each file's path")
+    add_toggle(pack, "code-block", "use_code_block", "wrap each file in a fenced code block")
+    add_toggle(pack, "dedupe", "dedupe", "write files with identical contents once and reference the first copy")
+    pack.add_argument("--workers", type=int, dest="read_workers", help="number of reader threads")
+    pack.add_argument("--max-file-bytes", type=int, help="truncate or skip files larger than this (0 for no limit)")
+    pack.add_argument("--max-line-length", type=int, help="skip files with a longer line, e.g. minified code (0 for no limit)")
+    pack.add_argument(
+        "--oversize",
+        choices=("truncate", "skip"),
+        dest="oversize_action",
+        help="what to do with files over --max-file-bytes",
+    )
+    add_toggle(pack, "index", "use_index", "use the persistent project index to skip unchanged folders")
+    pack.add_argument("--max-tokens", type=int, help="only keep the files that fit in this many tokens")
+    pack.add_argument(
+        "--priority",
+        action="append",
+        dest="budget_priorities",
+        help="token budget priority rule, repeatable: glob:<pattern>, recent, oldest, smaller, larger",
+    )
+    pack.add_argument("--split-tokens", type=int, dest="split_max_tokens", help="write numbered parts of at most this many tokens")
+    pack.add_argument("--split-bytes", type=int, dest="split_max_bytes", help="write numbered parts of at most this many bytes")
+    add_toggle(pack, "git-index", "use_git_index", "list the files tracked in the git index instead of walking the folder")
+    pack.add_argument("--git-base", metavar="REF", help="only pack files changed since this git ref (untracked files included)")
+    pack.add_argument(
+        "--git-target", metavar="REF",
+        help="with --git-base, pack the changes up to this ref, read from git, instead of the working tree",
+    )
+    pack.add_argument("--tokenizer-vocab", help="tiktoken-format BPE rank file used for token counts")
+    pack.add_argument("--timings", action="store_true", help="print the time spent in each phase to stderr")
+    pack.add_argument("--trace", metavar="FILE", help="record phase timings and write them to FILE")
+    pack.add_argument(
+        "--trace-format", choices=["chrome", "json"], default="chrome",
+        help="format of --trace: Chrome trace events or a JSON summary (default: chrome)",
+    )
+
+    serve = commands.add_parser("serve", help="answer JSON-RPC requests from editors and scripts, keeping projects warm")
+    serve.add_argument("--socket", metavar="PATH", help="listen on this Unix socket instead of stdin/stdout")
+    serve.add_argument("--settings", default=SETTINGS_FILE, help=f"settings file (default: {SETTINGS_FILE})")
+    serve.add_argument(
+        "--poll", type=float, default=1.0, metavar="SECONDS",
+        help="how often to check the projects for changes (default: 1.0)",
+    )
+    return parser
+
+
+def run_pack(args):
+    settings = load_settings(args.settings)
+    for key in (
+        "allowed_exts", "excluded_dirs", "excluded_files", "use_gitignore",
+        "as_markdown", "include_heading", "use_code_block", "dedupe",
+        "read_workers", "max_file_bytes", "max_line_length", "oversize_action", "use_index", "use_git_index",
+        "max_tokens", "budget_priorities", "tokenizer_vocab", "split_max_tokens", "split_max_bytes",
+    ):
+        value = getattr(args, key)
+        if value is not None:
+            settings[key] = value
+
+    src = Path(args.src)
+    if not src.is_dir():
+        raise SystemExit(f"promptpack: source folder not found: {src}")
+    dest = Path(args.output)
+    if not dest.is_dir():
+        raise SystemExit(f"promptpack: destination folder not found: {dest}")
+
+    tracer.enabled = bool(args.timings or args.trace)
+    # A one-shot pack reads each file once unless tokens are counted before
+    # writing, so contents are only kept for that second read.
+    reread = settings["max_tokens"] or settings["split_max_tokens"]
+    cache = ContentCache(settings["cache_max_bytes"] if reread else 0, file_limits(settings))
+    tracer.register_cache("content cache", cache)
+    root = src
+    deleted = []
+    if args.git_base:
+        from .git import GitError, git_selection
+
+        try:
+            root, files, deleted = git_selection(src, settings, args.git_base, args.git_target)
+        except GitError as e:
+            raise SystemExit(f"promptpack: {e}")
+        index = None
+    elif args.git_target:
+        raise SystemExit("promptpack: --git-target needs --git-base")
+    else:
+        from .index import scan_project
+
+        index, names = scan_project(src, settings)
+        files = [src / name for name in names]
+    files = sorted(files)
+    try:
+        if not files:
+            raise SystemExit(f"promptpack: no files changed since {args.git_base}" if args.git_base else "promptpack: no files selected")
+
+        token_counter = None
+        if settings["max_tokens"] or settings["split_max_tokens"]:
+            from .tokenizer import TokenCounter, load_tokenizer
+
+            try:
+                token_counter = TokenCounter(load_tokenizer(settings), store=index)
+            except (OSError, ValueError) as e:
+                raise SystemExit(f"promptpack: cannot load tokenizer: {e}")
+            tracer.register_cache("token cache", token_counter)
+
+        report = {}
+        try:
+            output_path = generate_output(
+                str(root),
+                str(dest),
+                files,
+                settings["as_markdown"],
+                settings["include_heading"],
+                settings["use_code_block"],
+                cache=cache,
+                workers=settings["read_workers"],
+                max_tokens=settings["max_tokens"],
+                priorities=settings["budget_priorities"],
+                token_counter=token_counter,
+                dedupe=settings["dedupe"],
+                split_tokens=settings["split_max_tokens"],
+                split_bytes=settings["split_max_bytes"],
+                report=report,
+            )
+        except ValueError as e:
+            raise SystemExit(f"promptpack: {e}")
+        for path, reason in report.get("dropped", []):
+            print(f"dropped {path.relative_to(root).as_posix()}: {reason}", file=sys.stderr)
+        for path, first in report.get("duplicates", []):
+            print(f"deduplicated {path.relative_to(root).as_posix()}: same as {first.relative_to(root).as_posix()}", file=sys.stderr)
+        for path, reason in report.get("skipped", []):
+            print(f"skipped {path.relative_to(root).as_posix()}: {reason}", file=sys.stderr)
+        for part in report.get("parts", []):
+            print(f"wrote {part}", file=sys.stderr)
+        for rel in deleted:
+            print(f"deleted since {args.git_base}: {rel}", file=sys.stderr)
+        if args.timings:
+            print(f"timings: {tracer.status_line()}", file=sys.stderr)
+        if args.trace:
+            if args.trace_format == "json":
+                tracer.export_json(args.trace)
+            else:
+                tracer.export_chrome(args.trace)
+        print(output_path)
+        return 0
+    finally:
+        if index is not None:
+            index.close()
+        if root != src:
+            # Contents exported from --git-target live in a temporary folder.
+            shutil.rmtree(root.parent, ignore_errors=True)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "pack":
+        return run_pack(args)
+    if args.command == "serve":
+        from .server import run_serve
+
+        return run_serve(args)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""File lists and contents from a local git repository.
+
+Everything goes through the ``git`` command line with ``subprocess``; no git
+library is needed. :func:`tracked_files` lists the files in the git index
+instead of walking the folder, :func:`changed_files` lists what changed
+since a base ref, and :class:`BlobReader` reads blob contents through a
+single ``git cat-file --batch`` process rather than one process per file.
+
+Paths are POSIX paths relative to the folder being packed, which may be a
+subfolder of the repository.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from .rules import SelectionRules
+from .utils import check_cancel
+
+# Mode of a submodule entry in the index; it has no contents to pack.
+GITLINK_MODE = "160000"
+
+# ``changed`` were added or modified since the base, ``deleted`` were removed.
+GitDelta = namedtuple("GitDelta", ["changed", "deleted"])
+
+
+class GitError(Exception):
+    """Raised when a git command fails or git is not installed."""
+
+
+def run_git(folder, *args) -> bytes:
+    try:
+        result = subprocess.run(
+            ["git", "-C", os.fspath(folder), *args],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+    except OSError as e:
+        raise GitError(f"cannot run git: {e}")
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", "replace").strip() or f"exit status {result.returncode}"
+        raise GitError(f"git {args[0]}: {message}")
+    return result.stdout
+
+
+def check_repository(folder):
+    """Raise :class:`GitError` unless ``folder`` is inside a git work tree."""
+    try:
+        inside = run_git(folder, "rev-parse", "--is-inside-work-tree").strip() == b"true"
+    except GitError:
+        inside = False
+    if not inside:
+        raise GitError(f"not a git repository: {folder}")
+
+
+def _split_z(output: bytes):
+    return [os.fsdecode(item) for item in output.split(b"\0") if item]
+
+
+def tracked_files(folder):
+    """Files in the git index below ``folder``, without submodules."""
+    rels = []
+    # --stage prefixes each path with "<mode> <object> <stage>\t".
+    for line in _split_z(run_git(folder, "ls-files", "-z", "--stage")):
+        info, _, rel = line.partition("\t")
+        if info.split(" ", 1)[0] != GITLINK_MODE:
+            rels.append(rel)
+    # Conflicted files have one entry per stage.
+    return list(dict.fromkeys(rels))
+
+
+def changed_files(folder, base: str, target: str = None) -> GitDelta:
+    """Files below ``folder`` that differ between ``base`` and ``target``.
+
+    Without ``target`` the working tree is compared, and untracked files
+    that are not ignored count as added. Renames are reported as a deletion
+    plus an addition.
+    """
+    args = ["diff", "--name-status", "-z", "--no-renames", "--relative", base]
+    if target:
+        args.append(target)
+    args.append("--")
+    items = _split_z(run_git(folder, *args))
+    changed, deleted = [], []
+    for status, rel in zip(items[::2], items[1::2]):
+        (deleted if status.startswith("D") else changed).append(rel)
+    if not target:
+        changed.extend(_split_z(run_git(folder, "ls-files", "-z", "--others", "--exclude-standard")))
+    return GitDelta(changed, deleted)
+
+
+class BlobReader:
+    """Reads objects through one long-running ``git cat-file --batch`` process.
+
+    Use as a context manager; :meth:`read` is safe to call from several
+    threads, requests are answered one at a time.
+    """
+
+    def __init__(self, folder):
+        try:
+            self._process = subprocess.Popen(
+                ["git", "-C", os.fspath(folder), "cat-file", "--batch"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise GitError(f"cannot run git: {e}")
+        self._lock = threading.Lock()
+
+    def read(self, spec: str):
+        """Contents of the file named by ``spec`` (e.g. ``HEAD:./src/app.py``), or None if it is missing or not a file."""
+        with self._lock:
+            stdin, stdout = self._process.stdin, self._process.stdout
+            stdin.write(os.fsencode(spec) + b"\n")
+            stdin.flush()
+            header = stdout.readline()
+            if not header:
+                raise GitError("git cat-file exited unexpectedly")
+            # The spec is echoed back for these and may itself contain spaces.
+            if header.endswith((b" missing\n", b" ambiguous\n")):
+                return None
+            _, kind, size = header.split()
+            data = stdout.read(int(size))
+            stdout.read(1)
+            return data if kind == b"blob" else None
+
+    def close(self):
+        if self._process.stdin:
+            self._process.stdin.close()
+        self._process.wait()
+        self._process.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def export_files(folder, rev: str, rels, dest, cancel=None):
+    """Write the contents of ``rels`` at ``rev`` under ``dest`` and return the paths written."""
+    written = []
+    with BlobReader(folder) as reader:
+        for rel in rels:
+            check_cancel(cancel)
+            data = reader.read(f"{rev}:./{rel}")
+            if data is None:
+                continue
+            path = Path(dest, rel)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            written.append(path)
+    return written
+
+
+def _selected(rels, settings):
+    rules = SelectionRules(dict(settings, use_gitignore=False))
+    return sorted(rel for rel in rels if rules.includes(rel))
+
+
+def tracked_selection(folder, settings):
+    """Relative POSIX paths of the files in the git index under ``folder`` that ``settings`` include."""
+    check_repository(folder)
+    return _selected(tracked_files(folder), settings)
+
+
+def git_selection(folder, settings, base: str = None, target: str = None, cancel=None):
+    """Files to pack from the git repository containing ``folder``.
+
+    Returns ``(root, files, deleted)``. With ``base`` only files changed
+    since that ref are listed, otherwise the files in the git index. The
+    selection settings are applied on top; ``.gitignore`` files are left to
+    git. With ``target`` the contents at that ref are exported to a
+    temporary folder named like ``folder``, which becomes ``root`` and which
+    the caller removes; otherwise ``root`` is ``folder``.
+    """
+    folder = Path(folder)
+    check_repository(folder)
+    if base:
+        rels, deleted = changed_files(folder, base, target)
+    else:
+        rels, deleted = tracked_files(folder), []
+    rels = _selected(rels, settings)
+    deleted = _selected(deleted, settings)
+    if not target:
+        return folder, [folder / rel for rel in rels], deleted
+    root = Path(tempfile.mkdtemp(prefix="promptpack-git-")) / folder.resolve().name
+    root.mkdir()
+    try:
+        return root, export_files(folder, target, rels, root, cancel), deleted
+    except BaseException:
+        shutil.rmtree(root.parent, ignore_errors=True)
+        raise
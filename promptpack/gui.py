@@ -1,13 +1,42 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog, Toplevel, ttk
+from tkinter import filedialog, font as tkfont, messagebox, simpledialog, Toplevel, ttk
 from pathlib import Path
+import bisect
 from datetime import datetime
-from tempfile import NamedTemporaryFile
 import webbrowser
-import markdown
 
+from .index import scan_project
+from .render import write_html_pages
+from .rules import SelectionRules
+from .selection import CHECKED, PARTIAL, UNCHECKED, SelectionModel
 from .settings import load_settings, save_settings
-from .utils import apply_icon, estimate_token_count, LANG_MAP, generate_output
+from .tokenizer import EstimateTokenizer, TokenCounter, load_tokenizer
+from .trace import tracer
+from .viewer import PreviewDocument, VirtualText
+from .utils import (
+    apply_icon,
+    LANG_MAP,
+    generate_output,
+    scan_dir,
+    walk_folder,
+    content_cache,
+    duplicate_block,
+    file_limits,
+    iter_file_texts,
+    check_cancel,
+    format_size,
+)
+from .worker import BackgroundJob
+
+
+# Toggles arriving within this window are applied to the preview in one go.
+PREVIEW_DEBOUNCE_MS = 150
+# A folder toggle changing more files than this rebuilds the preview instead of patching it.
+PREVIEW_PATCH_LIMIT = 50
+# How often a replaced project index is retried for closing while jobs still use it.
+INDEX_CLOSE_RETRY_MS = 200
+# Settings that change which files a scan selects by default.
+SELECTION_SETTINGS = ("allowed_exts", "excluded_dirs", "excluded_files", "use_gitignore", "use_git_index", "use_index")
 
 
 class ListDialog(simpledialog.Dialog):
@@ -36,25 +65,85 @@ class PromptPackApp:
         apply_icon(root)
 
         self.settings = load_settings()
+        content_cache.resize(self.settings["cache_max_bytes"])
+        content_cache.set_limits(file_limits(self.settings))
+        self.token_counter = TokenCounter(self.load_tokenizer())
+        tracer.register_cache("token cache", self.token_counter)
+        tracer.enabled = self.settings["trace"]
 
         self.as_markdown = tk.BooleanVar(value=self.settings["as_markdown"])
         self.include_heading = tk.BooleanVar(value=self.settings["include_heading"])
         self.use_code_block = tk.BooleanVar(value=self.settings["use_code_block"])
+        self.dedupe = tk.BooleanVar(value=self.settings["dedupe"])
+        self.use_gitignore = tk.BooleanVar(value=self.settings["use_gitignore"])
+        self.use_git_index = tk.BooleanVar(value=self.settings["use_git_index"])
         self.theme = tk.StringVar(value=self.settings.get("theme", "dark"))
         self.enable_preview = tk.BooleanVar(value=False)
+        self.max_tokens = tk.StringVar(value=str(self.settings["max_tokens"] or ""))
 
         self.start_folder = tk.StringVar()
         self.dest_folder = tk.StringVar()
         self.selected_files = set()
+        self.selection_root = None
+        self.project_index = None
+        # Indexes replaced by a rescan, closed once no job can still reach them.
+        self.retired_indexes = []
+        # Jobs started so far that may still be running, cancelled ones included.
+        self.started_jobs = []
+        self.job = None
+        self.status_text = tk.StringVar(value="Ready")
+        self.record_timings = tk.BooleanVar(value=self.settings["trace"])
+        self.timing_text = tk.StringVar(value="")
 
         self.preview_window = None
-        self.preview_text = None
+        self.preview_view = None
+        self.preview_outline = None
+        self.preview_doc = PreviewDocument(self.load_preview_segment)
+        self.preview_doc_options = None
+        self.preview_project = ""
+        self.preview_tokens = {}
+        self.preview_digests = {}
+        # Digest -> previewed files with it, sorted; only kept while deduplicating.
+        self.preview_groups = {}
+        # Tokens saved per duplicate (every file of a group but the first), and their sum.
+        self.preview_dup_savings = {}
+        self.preview_dedupe_saved = 0
+        self.preview_files = set()
+        self.preview_token_total = 0
+        self.preview_target = set()
+        self.preview_pending = set()
+        self.preview_rebuild_pending = False
+        self.preview_after_id = None
+        self.preview_job = None
+        self.preview_generation = 0
+
+        for var in (self.as_markdown, self.include_heading, self.use_code_block):
+            var.trace_add("write", self.on_format_option_changed)
+        self.dedupe.trace_add("write", self.on_dedupe_changed)
 
         style = ttk.Style(self.root)
         style.configure("Heading.TLabel", font=("TkDefaultFont", 15, "bold"))
 
         self.build_gui()
         self.apply_theme()
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        # Token counts reach the index in batches; the last one is committed here.
+        self.cancel_preview_refresh()
+        if self.job is not None:
+            self.job.cancel()
+        for index in self.retired_indexes + [self.project_index]:
+            if index is not None:
+                index.close()
+        self.retired_indexes = []
+        self.project_index = self.token_counter.store = None
+        self.root.destroy()
+
+    def flush_index(self):
+        """Commit the token counts written to the project index so far."""
+        if self.project_index is not None:
+            self.project_index.flush()
 
     def build_gui(self):
         # Rende le 3 colonne espandibili per migliore distribuzione
@@ -109,8 +198,14 @@ class PromptPackApp:
         ttk.Button(self.root, text="Browse", command=self.browse_dest)\
             .grid(row=6, column=2, padx=5, pady=5)
 
+        ttk.Label(self.root, text="Token Budget")\
+            .grid(row=7, column=0, sticky="w", padx=10, pady=5)
+
+        ttk.Entry(self.root, textvariable=self.max_tokens, width=50)\
+            .grid(row=7, column=1, padx=5, pady=5)
+
         ttk.Button(self.root, text="Generate", command=self.generate)\
-            .grid(row=7, column=1, pady=10)
+            .grid(row=8, column=1, pady=10)
 
         # Settings gear button
         gear_button = ttk.Button(
@@ -119,10 +214,24 @@ class PromptPackApp:
             command=self.configure_settings,
             style="Gear.TButton"
         )
-        gear_button.grid(row=8, column=2, sticky="e", pady=5, padx=5)
+        gear_button.grid(row=9, column=2, sticky="e", pady=5, padx=5)
         gear_button.bind("<Enter>", lambda e: gear_button.config(cursor="hand2"))
         gear_button.bind("<Leave>", lambda e: gear_button.config(cursor=""))
 
+        # Progress of background jobs
+        self.progress_bar = ttk.Progressbar(self.root, mode="determinate")
+        self.progress_bar.grid(row=10, column=0, sticky="ew", padx=10, pady=5)
+
+        ttk.Label(self.root, textvariable=self.status_text)\
+            .grid(row=10, column=1, sticky="w", padx=5, pady=5)
+
+        self.cancel_button = ttk.Button(self.root, text="Cancel", command=self.cancel_job, state="disabled")
+        self.cancel_button.grid(row=10, column=2, padx=5, pady=5)
+
+        # Phase timings of the last operation, filled in when timings are recorded
+        ttk.Label(self.root, textvariable=self.timing_text, foreground="gray")\
+            .grid(row=11, column=0, columnspan=3, sticky="w", padx=10, pady=(0, 5))
+
 
 
 
@@ -188,6 +297,11 @@ class PromptPackApp:
             padding=2,
         )
         style.map("Gear.TButton", background=[], foreground=[])
+        style.map(
+            "TNotebook.Tab",
+            background=[("selected", palette["activeBackground"])],
+            foreground=[("selected", palette["activeForeground"])],
+        )
 
         style.map("TCheckbutton", background=[], foreground=[])
         style.configure(
@@ -199,14 +313,15 @@ class PromptPackApp:
 
         if self.preview_window and self.preview_window.winfo_exists():
             self.preview_window.tk_setPalette(**palette)
-            if self.preview_text:
-                self.preview_text.configure(bg=palette["background"], fg=palette["foreground"])
+            if self.preview_view:
+                self.preview_view.text.configure(bg=palette["background"], fg=palette["foreground"])
+                self.preview_outline.configure(bg=palette["background"], fg=palette["foreground"])
 
     def browse_start(self):
         folder = filedialog.askdirectory()
         if folder:
             self.start_folder.set(folder)
-            self.update_default_selected_files(Path(folder))
+            self.scan_start_folder(Path(folder))
 
     def browse_dest(self):
         folder = filedialog.askdirectory()
@@ -217,31 +332,89 @@ class PromptPackApp:
         win = Toplevel(self.root)
         win.title("Settings")
         apply_icon(win)
-        win.geometry("500x500")
+        # The list dialogs write to self.settings before Save, so compare against this.
+        selection_settings = {key: self.settings.get(key) for key in SELECTION_SETTINGS}
 
-        style = ttk.Style(win)
-        style.configure("Heading.TLabel", font=("TkDefaultFont", 15, "bold"))
+        # One tab per section keeps the window short enough for small screens.
+        notebook = ttk.Notebook(win)
+        notebook.pack(fill="both", expand=True, padx=10, pady=(10, 0))
 
+        def add_tab(title):
+            frame = ttk.Frame(notebook, padding=10)
+            notebook.add(frame, text=title)
+            return frame
 
         def prompt_list(title, key):
             dlg = ListDialog(win, title, initial_value=",".join(self.settings[key]))
             result = dlg.result
             if result is not None:
                 self.settings[key] = [x.strip() for x in result.split(",") if x.strip()]
-        ttk.Label(win, text="Default Selection", style="Heading.TLabel").pack(padx=10, pady=(20, 5))
-        ttk.Button(win, text="Defailt Allowed Extensions", command=lambda: prompt_list("Defailt Allowed Extensions", "allowed_exts")).pack(pady=5)
-        ttk.Button(win, text="Defailt Excluded Directories", command=lambda: prompt_list("Defailt Excluded Directories", "excluded_dirs")).pack(pady=5)
-        ttk.Button(win, text="Defailt Excluded Files", command=lambda: prompt_list("Defailt Excluded Files", "excluded_files")).pack(pady=5)
+        tab = add_tab("Default Selection")
+        ttk.Button(tab, text="Defailt Allowed Extensions", command=lambda: prompt_list("Defailt Allowed Extensions", "allowed_exts")).pack(pady=5)
+        ttk.Button(tab, text="Defailt Excluded Directories", command=lambda: prompt_list("Defailt Excluded Directories", "excluded_dirs")).pack(pady=5)
+        ttk.Button(tab, text="Defailt Excluded Files", command=lambda: prompt_list("Defailt Excluded Files", "excluded_files")).pack(pady=5)
+        ttk.Button(tab, text="Token Budget Priorities", command=lambda: prompt_list("Token Budget Priorities", "budget_priorities")).pack(pady=5)
+        ttk.Checkbutton(tab, text="Respect .gitignore Files", variable=self.use_gitignore).pack(pady=5)
+        ttk.Checkbutton(tab, text="List Files from Git Index", variable=self.use_git_index).pack(pady=5)
+
+        tab = add_tab("Output Options")
+        ttk.Checkbutton(tab, text="Markdown Format", variable=self.as_markdown).pack(pady=5)
+        ttk.Checkbutton(tab, text="Include File Headings", variable=self.include_heading).pack(pady=5)
+        ttk.Checkbutton(tab, text="Use Code Blocks", variable=self.use_code_block).pack(pady=5)
+        ttk.Checkbutton(tab, text="Deduplicate Identical Files", variable=self.dedupe).pack(pady=5)
+
+        def prompt_limit(title, key):
+            value = simpledialog.askinteger(
+                title, f"{title} (0 writes a single file):", parent=win, initialvalue=self.settings[key], minvalue=0
+            )
+            if value is not None:
+                self.settings[key] = value
+
+        ttk.Button(tab, text="Split Output by Tokens", command=lambda: prompt_limit("Split Output by Tokens", "split_max_tokens")).pack(pady=5)
+        ttk.Button(tab, text="Split Output by Bytes", command=lambda: prompt_limit("Split Output by Bytes", "split_max_bytes")).pack(pady=5)
+
+        tokenizer_vocab = self.settings.get("tokenizer_vocab", "")
+
+        def choose_vocab():
+            path = filedialog.askopenfilename(
+                parent=win,
+                title="Tokenizer Vocabulary",
+                filetypes=[("BPE ranks", "*.tiktoken"), ("All files", "*")],
+            )
+            if path:
+                self.settings["tokenizer_vocab"] = path
+
+        def clear_vocab():
+            self.settings["tokenizer_vocab"] = ""
 
-        ttk.Label(win, text="Output Options", style="Heading.TLabel").pack(padx=10, pady=(20, 5))
-        ttk.Checkbutton(win, text="Markdown Format", variable=self.as_markdown).pack(pady=5)
-        ttk.Checkbutton(win, text="Include File Headings", variable=self.include_heading).pack(pady=5)
-        ttk.Checkbutton(win, text="Use Code Blocks", variable=self.use_code_block).pack(pady=5)
+        ttk.Button(tab, text="Tokenizer Vocabulary", command=choose_vocab).pack(pady=5)
+        ttk.Button(tab, text="Use Token Estimate", command=clear_vocab).pack(pady=5)
+
+        def export_timings(chrome):
+            path = filedialog.asksaveasfilename(
+                parent=win,
+                title="Export Chrome Trace" if chrome else "Export Timings",
+                defaultextension=".json",
+                filetypes=[("JSON", "*.json"), ("All files", "*")],
+            )
+            if not path:
+                return
+            try:
+                if chrome:
+                    tracer.export_chrome(path)
+                else:
+                    tracer.export_json(path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not write timings:\n{e}", parent=win)
 
+        tab = add_tab("Diagnostics")
+        ttk.Checkbutton(tab, text="Record Timings", variable=self.record_timings).pack(pady=5)
+        ttk.Button(tab, text="Export Timings (JSON)", command=lambda: export_timings(False)).pack(pady=5)
+        ttk.Button(tab, text="Export Chrome Trace", command=lambda: export_timings(True)).pack(pady=5)
 
-        ttk.Label(win, text="Theme", style="Heading.TLabel").pack(padx=10, pady=(20, 5))
-        ttk.Radiobutton(win, text="Chiaro", variable=self.theme, value="light", command=self.apply_theme).pack(pady=5)
-        ttk.Radiobutton(win, text="Scuro", variable=self.theme, value="dark", command=self.apply_theme).pack(pady=5)
+        tab = add_tab("Theme")
+        ttk.Radiobutton(tab, text="Chiaro", variable=self.theme, value="light", command=self.apply_theme).pack(pady=5)
+        ttk.Radiobutton(tab, text="Scuro", variable=self.theme, value="dark", command=self.apply_theme).pack(pady=5)
 
         def save_and_close():
             new_settings = {
@@ -249,117 +422,459 @@ class PromptPackApp:
                 "as_markdown": self.as_markdown.get(),
                 "include_heading": self.include_heading.get(),
                 "use_code_block": self.use_code_block.get(),
+                "dedupe": self.dedupe.get(),
+                "use_gitignore": self.use_gitignore.get(),
+                "use_git_index": self.use_git_index.get(),
+                "trace": self.record_timings.get(),
                 "theme": self.theme.get(),
             }
+            max_tokens = self.parse_max_tokens()
+            if max_tokens is not None:
+                new_settings["max_tokens"] = max_tokens
             save_settings(new_settings)
             self.settings = new_settings
+            if new_settings.get("tokenizer_vocab", "") != tokenizer_vocab:
+                self.token_counter = TokenCounter(self.load_tokenizer(), store=self.project_index)
+                tracer.register_cache("token cache", self.token_counter)
+            tracer.enabled = new_settings["trace"]
+            if not tracer.enabled:
+                self.timing_text.set("")
             self.apply_theme()
             win.destroy()
+            if any(new_settings.get(key) != value for key, value in selection_settings.items()):
+                # The current selection was made under the old rules.
+                self.selection_root = None
+                self.selected_files = set()
+                if self.start_folder.get():
+                    self.scan_start_folder(Path(self.start_folder.get()))
 
         ttk.Button(win, text="Save", command=save_and_close).pack(pady=10)
 
-    def is_valid(self, f: Path) -> bool:
-        return f.suffix in self.settings["allowed_exts"] and f.name not in self.settings["excluded_files"]
-
-    def update_default_selected_files(self, folder_path: Path):
-        all_files = folder_path.rglob("*")
-        self.selected_files = {
-            f
-            for f in all_files
-            if f.is_file()
-            and self.is_valid(f)
-            and not any(excl in f.parts for excl in self.settings["excluded_dirs"])
-        }
+    def scan_start_folder(self, folder_path: Path, then=None):
+        """Compute the default selection on a worker thread, then call ``then``."""
+        settings = dict(self.settings)
+
+        def scan(cancel, progress):
+            index, names = scan_project(folder_path, settings, cancel, progress)
+            return index, SelectionModel(folder_path, names)
+
+        def done(result):
+            index, files = result
+            if self.project_index is not None:
+                self.retired_indexes.append(self.project_index)
+            # Token counts persist in the index so they survive restarts.
+            self.project_index = self.token_counter.store = index
+            self.close_retired_indexes()
+            self.selection_root = folder_path
+            self.selected_files = files
+            if then:
+                then()
+
+        self.run_job("Scanning", scan, done)
+
+    def track_job(self, job):
+        self.started_jobs = [other for other in self.started_jobs if other.running()]
+        self.started_jobs.append(job)
+
+    def close_retired_indexes(self):
+        # A preview rebuild, even a cancelled one, may still be counting
+        # tokens through the old index, so it stays open until they end.
+        if not self.retired_indexes:
+            return
+        self.started_jobs = [job for job in self.started_jobs if job.running()]
+        if self.started_jobs:
+            self.root.after(INDEX_CLOSE_RETRY_MS, self.close_retired_indexes)
+            return
+        retired, self.retired_indexes = self.retired_indexes, []
+        for index in retired:
+            index.close()
+
+    def run_job(self, description, func, on_done, total=None):
+        """Run ``func(cancel, progress)`` in the background with progress in the status row."""
+        if self.job is not None and self.job.running():
+            messagebox.showwarning("Busy", "Another operation is still running. Cancel it or wait for it to finish.")
+            return
+        self.status_text.set(f"{description}...")
+        if total:
+            self.progress_bar.configure(mode="determinate", maximum=total, value=0)
+        else:
+            self.progress_bar.configure(mode="indeterminate")
+            self.progress_bar.start(10)
+        self.cancel_button.state(["!disabled"])
+        if tracer.enabled:
+            tracer.reset()
+            job = func
+
+            def func(cancel, progress):
+                with tracer.span(description.lower()):
+                    return job(cancel, progress)
+
+        def on_progress(files, nbytes):
+            if total:
+                self.progress_bar.configure(value=files)
+            detail = f"{files} files, {format_size(nbytes)}" if nbytes else f"{files} files"
+            self.status_text.set(f"{description}: {detail}")
+
+        def on_error(e):
+            messagebox.showerror("Error", str(e))
+
+        def on_finish(kind):
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="determinate", value=0)
+            self.cancel_button.state(["disabled"])
+            self.status_text.set("Cancelled" if kind == "cancelled" else "Ready")
+            self.show_timings()
+            self.flush_index()
+
+        self.job = BackgroundJob(self.root, func, on_done, on_error, on_progress, on_finish).start()
+        self.track_job(self.job)
+
+    def show_timings(self):
+        if tracer.enabled:
+            self.timing_text.set(tracer.status_line())
+
+    def cancel_job(self):
+        if self.job is not None:
+            self.job.cancel()
+            self.status_text.set("Cancelling...")
+
+    def on_format_option_changed(self, *args):
+        if self.enable_preview.get():
+            self.schedule_preview_refresh(self.preview_target or self.selected_files)
+
+    def on_dedupe_changed(self, *args):
+        # Deduplication only changes the header's totals, not the segments,
+        # but digests are only taken while it is on.
+        if self.dedupe.get():
+            if self.enable_preview.get():
+                self.schedule_preview_refresh(self.preview_target or self.selected_files)
+        elif self.preview_window and self.preview_window.winfo_exists() and self.preview_view is not None:
+            self.set_preview_digests(())
+            self.update_preview_header()
 
     def toggle_preview_window(self):
         if self.enable_preview.get():
-            preview_text = self.get_preview_text(self.selected_files)
-            if self.preview_window is None or not self.preview_window.winfo_exists():
-                self.preview_window = Toplevel(self.root)
-                self.preview_window.title("Preview")
-                apply_icon(self.preview_window)
-                self.preview_text = tk.Text(self.preview_window, wrap="word")
-                self.preview_text.pack(fill="both", expand=True)
-                self.apply_theme()
-            self.preview_text.delete("1.0", "end")
-            self.preview_text.insert("1.0", preview_text)
+            self.schedule_preview_refresh(self.selected_files)
         else:
+            self.cancel_preview_refresh()
             if self.preview_window and self.preview_window.winfo_exists():
                 self.preview_window.destroy()
                 self.preview_window = None
 
+    def open_preview_window(self):
+        if self.preview_window is None or not self.preview_window.winfo_exists():
+            self.preview_window = Toplevel(self.root)
+            self.preview_window.title("Preview")
+            apply_icon(self.preview_window)
+            panes = ttk.PanedWindow(self.preview_window, orient="horizontal")
+            panes.pack(fill="both", expand=True)
+            # The outline lists the files in preview order; clicking one jumps to its segment.
+            self.preview_outline = tk.Listbox(panes, exportselection=False, width=32)
+            self.preview_outline.bind("<<ListboxSelect>>", self.on_outline_select)
+            self.preview_view = VirtualText(panes, self.preview_doc, on_section=self.on_preview_section, wrap="word")
+            panes.add(self.preview_outline, weight=1)
+            panes.add(self.preview_view, weight=4)
+            self.apply_theme()
+            self.preview_files = set()
+        return self.preview_view
+
+    def on_outline_select(self, event):
+        selection = self.preview_outline.curselection()
+        if selection:
+            self.preview_view.goto(self.preview_doc.segment_start(selection[0]))
+
+    def on_preview_section(self, index):
+        outline = self.preview_outline
+        outline.selection_clear(0, "end")
+        if index >= 0:
+            outline.selection_set(index)
+            outline.see(index)
+
+    def outline_label(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.preview_doc_options[0]).as_posix()
+        except ValueError:
+            return str(path)
+
+    def load_preview_segment(self, path: Path) -> str:
+        """Lines of one file's segment for the preview viewer, formatted again from the content cache."""
+        content = content_cache.read_text(path)
+        return self.format_preview_segment(path, content, self.preview_doc_options)[1:]
+
+    def schedule_preview_refresh(self, target, path: Path = None):
+        """Queue a preview update and coalesce it with others in the debounce window.
+
+        ``target`` is the set of files the preview should show. With ``path``
+        only that file's segment is patched; without it the preview is rebuilt.
+        """
+        self.preview_target = target
+        if path is None:
+            self.preview_rebuild_pending = True
+        else:
+            self.preview_pending.add(path)
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+        self.preview_after_id = self.root.after(PREVIEW_DEBOUNCE_MS, self.flush_preview_refresh)
+
+    def cancel_preview_refresh(self):
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+            self.preview_after_id = None
+        if self.preview_job is not None:
+            self.preview_job.cancel()
+            self.preview_job = None
+        self.preview_generation += 1
+        self.preview_pending.clear()
+        self.preview_rebuild_pending = False
+
+    def flush_preview_refresh(self):
+        self.preview_after_id = None
+        if not self.enable_preview.get():
+            return
+        window_open = self.preview_window is not None and self.preview_window.winfo_exists()
+        if self.preview_rebuild_pending or not window_open:
+            self.preview_rebuild_pending = False
+            self.preview_pending.clear()
+            self.start_preview_rebuild(self.preview_target)
+            return
+        if self.preview_job is not None and self.preview_job.running():
+            # The rebuild in flight reconciles with the target when it lands.
+            self.preview_pending.clear()
+            return
+        pending, self.preview_pending = self.preview_pending, set()
+        for path in sorted(pending):
+            self.patch_preview(path, path in self.preview_target)
+        self.update_preview_header()
+
+    def start_preview_rebuild(self, included_files):
+        """Read and format the preview on a worker thread, dropping any older rebuild."""
+        if self.preview_job is not None:
+            self.preview_job.cancel()
+        self.preview_generation += 1
+        generation = self.preview_generation
+        files = sorted(included_files)
+        options = self.preview_options()
+        workers = self.settings["read_workers"]
+        dedupe = self.dedupe.get()
+
+        # A preview refresh during a pack or scan adds to that job's timings.
+        if tracer.enabled and (self.job is None or not self.job.running()):
+            tracer.reset()
+
+        def build(cancel, progress):
+            skipped = []
+            return self.build_preview_segments(files, options, workers, dedupe, cancel, skipped), skipped
+
+        def done(result):
+            self.flush_index()
+            if generation == self.preview_generation:
+                segments, skipped = result
+                self.preview_job = None
+                self.apply_preview(segments, options)
+                self.show_timings()
+                if skipped:
+                    self.status_text.set(f"Preview: {len(skipped)} file(s) skipped (binary, minified or too large)")
+
+        def failed(e):
+            self.flush_index()
+            self.status_text.set(f"Preview failed: {e}")
+
+        self.preview_job = BackgroundJob(self.root, build, done, failed).start()
+        self.track_job(self.preview_job)
+
+    def build_preview_segments(self, files, options, workers, dedupe, cancel=None, skipped=None):
+        """``(path, lines, tokens, digest)`` for each readable file, in order."""
+        # Only each segment's size is kept; the viewer formats again what it shows.
+        segments = []
+        with tracer.span("preview", files=len(files)):
+            for path, content in iter_file_texts(files, workers, content_cache, skipped=skipped):
+                check_cancel(cancel)
+                segment = self.format_preview_segment(path, content, options)
+                tokens = self.count_segment_tokens(path, segment, options)
+                lines = PreviewDocument.line_count(segment) - 1
+                segments.append((path, lines, tokens, self.file_digest(path) if dedupe else None))
+        return segments
+
+    def apply_preview(self, segments, options):
+        """Fill the preview from scratch with ``(path, lines, tokens, digest)`` per file."""
+        view = self.open_preview_window()
+        self.preview_doc_options = options
+        self.preview_tokens = {}
+
+        project_line = self.preview_project_line(options[0])
+        self.preview_project = project_line
+        self.preview_token_total = self.token_counter.count(project_line)
+        paths = []
+        for path, lines, tokens, _ in segments:
+            paths.append(path)
+            self.preview_tokens[path] = tokens
+            self.preview_token_total += tokens
+        self.set_preview_digests((path, digest) for path, _, _, digest in segments)
+        self.preview_doc.reset(paths, [lines for _, lines, _, _ in segments])
+        self.preview_files = set(paths)
+        self.preview_outline.delete(0, "end")
+        self.preview_outline.insert("end", *map(self.outline_label, paths))
+        view.section = None
+
+        # Toggles made while the rebuild was running are patched in now.
+        for path in sorted(self.preview_files.symmetric_difference(self.preview_target)):
+            self.patch_preview(path, path in self.preview_target)
+        self.update_preview_header()
+        view.goto(0)
+
+    def patch_preview(self, path: Path, included: bool):
+        """Insert or remove the segment of a single file in the open preview."""
+        if (path in self.preview_files) == included:
+            return
+
+        doc = self.preview_doc
+        pos = bisect.bisect_left(doc.paths, path)
+        if included:
+            try:
+                content = content_cache.read_text(path)
+            except Exception:
+                return
+            options = self.preview_doc_options
+            segment = self.format_preview_segment(path, content, options)
+            doc.insert(pos, path, PreviewDocument.line_count(segment) - 1)
+            self.preview_outline.insert(pos, self.outline_label(path))
+            self.preview_files.add(path)
+            self.preview_tokens[path] = tokens = self.count_segment_tokens(path, segment, options)
+            self.preview_token_total += tokens
+            if self.dedupe.get():
+                self.add_preview_digest(path, self.file_digest(path))
+        else:
+            doc.remove(pos)
+            self.preview_outline.delete(pos)
+            self.preview_files.discard(path)
+            self.remove_preview_digest(path)
+            self.preview_token_total -= self.preview_tokens.pop(path)
+
+    def update_preview_header(self):
+        header = self.preview_header(self.preview_token_total)
+        if self.dedupe.get() and self.preview_dup_savings:
+            files, saved = len(self.preview_dup_savings), self.preview_dedupe_saved
+            note = f" ({saved} saved by deduplicating {files} file(s))"
+            header = self.preview_header(self.preview_token_total - saved, note)
+        self.preview_doc.set_header(header.rstrip("\n") + "\n" + self.preview_project)
+        self.preview_view.refresh()
+        self.update_preview_title()
+
+    def set_preview_digests(self, digests):
+        """Group the previewed files by ``(path, digest)`` pairs given in preview order."""
+        self.preview_digests = {}
+        self.preview_groups = {}
+        self.preview_dup_savings = {}
+        self.preview_dedupe_saved = 0
+        for path, digest in digests:
+            if digest is not None:
+                self.preview_digests[path] = digest
+                self.preview_groups.setdefault(digest, []).append(path)
+        for digest, group in self.preview_groups.items():
+            if len(group) > 1:
+                self.regroup_duplicates(digest)
+
+    def add_preview_digest(self, path: Path, digest):
+        if digest is None:
+            return
+        self.preview_digests[path] = digest
+        group = self.preview_groups.setdefault(digest, [])
+        pos = bisect.bisect_left(group, path)
+        group.insert(pos, path)
+        if pos == 0:
+            self.regroup_duplicates(digest)
+        else:
+            saving = self.preview_dup_savings[path] = self.dedupe_saving(path, group[0])
+            self.preview_dedupe_saved += saving
+
+    def remove_preview_digest(self, path: Path):
+        digest = self.preview_digests.pop(path, None)
+        if digest is None:
+            return
+        group = self.preview_groups[digest]
+        pos = bisect.bisect_left(group, path)
+        del group[pos]
+        self.preview_dedupe_saved -= self.preview_dup_savings.pop(path, 0)
+        if not group:
+            del self.preview_groups[digest]
+        elif pos == 0:
+            self.regroup_duplicates(digest)
+
+    def regroup_duplicates(self, digest):
+        """Recount the savings of a group's duplicates after its first file changed."""
+        group = self.preview_groups[digest]
+        self.preview_dedupe_saved -= self.preview_dup_savings.pop(group[0], 0)
+        for path in group[1:]:
+            saving = self.dedupe_saving(path, group[0])
+            self.preview_dedupe_saved += saving - self.preview_dup_savings.get(path, 0)
+            self.preview_dup_savings[path] = saving
+
+    def dedupe_saving(self, path: Path, first: Path) -> int:
+        """Tokens saved by writing a reference to ``first`` instead of ``path``."""
+        start_folder, include_heading, _ = self.preview_doc_options
+        reference = duplicate_block(start_folder, path, first, include_heading)
+        return self.preview_tokens[path] - self.token_counter.count(reference)
+
+    def file_digest(self, path: Path):
+        try:
+            return content_cache.digest(path)
+        except Exception:
+            return None
+
+    def update_preview_title(self):
+        stats = content_cache.stats()
+        self.preview_window.title(f"Preview (cache: {stats['hits']} hits, {stats['misses']} misses)")
+
     def preview_in_browser(self):
         if not self.selected_files:
             messagebox.showwarning("No Files", "No files selected for preview.")
             return
-        markdown_text = self.get_preview_text(self.selected_files)
-        html_body = markdown.markdown(markdown_text, extensions=['fenced_code', 'codehilite'])
-
-        dark_css = """
-        <style>
-        body {
-            background-color: #1e1e1e;
-            color: #d4d4d4;
-            font-family: sans-serif;
-            padding: 20px;
-        }
-        pre, code {
-            background-color: #2d2d2d;
-            color: #dcdcdc;
-            font-family: monospace;
-            padding: 5px;
-            border-radius: 5px;
-            overflow-x: auto;
-            white-space: pre;
-            word-break: normal;
-            line-height: 1.4;
-        }
-
-        h2 {
-            color: #569cd6;
-        }
-        </style>
-        """
+        files = set(self.selected_files)
+        options = self.preview_options()
+        theme = self.theme.get()
+        self.run_job(
+            "Rendering preview",
+            lambda cancel, progress: self.write_preview_html(files, options, theme, cancel, progress),
+            lambda html_path: webbrowser.open(f"file://{html_path}"),
+            total=len(files),
+        )
 
-        light_css = """
-        <style>
-        body {
-            background-color: #ffffff;
-            color: #000000;
-            font-family: sans-serif;
-            padding: 20px;
-        }
-        pre, code {
-            background-color: #f5f5f5;
-            color: #000000;
-            font-family: monospace;
-            padding: 5px;
-            border-radius: 5px;
-            overflow-x: auto;
-            white-space: pre;
-            word-break: normal;
-            line-height: 1.4;
-        }
+    def write_preview_html(self, included_files, options, theme, cancel=None, progress=None):
+        """Render the preview to temporary HTML pages and return the one to open; runs off the Tk thread.
 
-        h2 {
-            color: #003366;
-        }
-        </style>
+        Each file is rendered separately through the render cache, so files
+        that did not change since the last preview are not highlighted again.
         """
-
-        css = dark_css if self.theme.get() == "dark" else light_css
-
-        html = f"<html><head>{css}</head><body>{html_body}</body></html>"
-        with NamedTemporaryFile("w", delete=False, suffix=".html", encoding="utf-8") as tmp:
-            tmp.write(html)
-            webbrowser.open(f"file://{tmp.name}")
+        start_folder = options[0]
+        project_line = self.preview_project_line(start_folder)
+        token_count = self.token_counter.count(project_line)
+        files = iter_file_texts(sorted(included_files), self.settings["read_workers"], content_cache)
+
+        def segments():
+            nonlocal token_count
+            for done, (path, content) in enumerate(files, 1):
+                check_cancel(cancel)
+                segment = self.format_preview_segment(path, content, options)
+                token_count += self.count_segment_tokens(path, segment, options)
+                yield path.relative_to(start_folder).as_posix(), segment
+                if progress is not None:
+                    progress(done, len(content))
+
+        return write_html_pages(lambda: self.preview_header(token_count) + project_line, segments(), theme)
 
     def select_files(self):
         folder = self.start_folder.get()
         if not folder:
             messagebox.showerror("Error", "Please select the source folder first")
             return
+        # The selection model is the source of truth for checked state, so
+        # files in folders that are never expanded keep their defaults.
+        if self.selection_root != Path(folder):
+            self.scan_start_folder(Path(folder), then=lambda: self.open_file_selector(folder))
+        else:
+            self.open_file_selector(folder)
 
+    def open_file_selector(self, folder):
         selector = Toplevel(self.root)
         selector.title("Select Files to Include")
         apply_icon(selector)
@@ -372,92 +887,192 @@ class PromptPackApp:
         tree.column("type", width=80)
         tree.pack(fill=tk.BOTH, expand=True)
 
-        checkbox_vars = {}
-
-        def insert_items(parent, path: Path):
-            for p in sorted(path.iterdir()):
-                if p.is_dir():
-                    node = tree.insert(parent, 'end', text=p.name, values=(str(p), "dir"), open=False)
-                    insert_items(node, p)
-                else:
-                    default_checked = self.is_valid(p) and not any(
-                        skip in p.parts for skip in self.settings["excluded_dirs"]
-                    )
-                    var = tk.BooleanVar(value=default_checked)
-                    checkbox_vars[str(p)] = var
-                    label = f"[{'x' if var.get() else ' '}] {p.name}"
-                    tree.insert(parent, 'end', text=label, values=(str(p), "file"))
-
-        insert_items('', Path(folder))
-
-        def update_preview_live():
-            if self.enable_preview.get():
-                preview_text = self.get_preview_text({Path(p) for p, var in checkbox_vars.items() if var.get()})
-                if self.preview_window is None or not self.preview_window.winfo_exists():
-                    self.preview_window = Toplevel(self.root)
-                    self.preview_window.title("Preview")
-                    apply_icon(self.preview_window)
-                    self.preview_text = tk.Text(self.preview_window, wrap="word")
-                    self.preview_text.pack(fill="both", expand=True)
-                    self.apply_theme()
-                self.preview_text.delete("1.0", "end")
-                self.preview_text.insert("1.0", preview_text)
+        # Edits go straight to the model and are rolled back unless confirmed.
+        selection = self.selected_files
+        selection.begin()
+        # Relative path -> tree item, for the rows that have been shown.
+        items = {}
+        rules = SelectionRules(self.settings, selection.root)
+        # Folders whose whole subtree has been interned.
+        walked = set()
+        marks = {CHECKED: "x", PARTIAL: "-", UNCHECKED: " "}
+        tree_font = ttk.Style(selector).lookup("Treeview", "font") or "TkDefaultFont"
+        box_width = tkfont.Font(root=selector, font=tree_font).measure("[x] ")
+
+        def file_label(rel):
+            return f"[{'x' if selection.is_checked(rel) else ' '}] {rel.rpartition('/')[2]}"
+
+        def folder_label(rel):
+            return f"[{marks[selection.folder_state(rel)]}] {rel.rpartition('/')[2]}"
+
+        def item_values(item):
+            # Tk hands back numeric-looking values as numbers, e.g. a folder named 2024.
+            return tuple(str(value) for value in tree.item(item, 'values'))
+
+        def insert_items(parent, folder_rel):
+            dirs, files = scan_dir(selection.root / folder_rel)
+            prefix = f"{folder_rel}/" if folder_rel else ""
+            for entry in dirs:
+                rel = prefix + entry.name
+                node = items[rel] = tree.insert(parent, 'end', text="", values=(rel, "dir"), open=False)
+                tree.insert(node, 'end', text="...", values=("", "placeholder"))
+            for entry in files:
+                rel = prefix + entry.name
+                selection.add(rel)
+                items[rel] = tree.insert(parent, 'end', text=file_label(rel), values=(rel, "file"))
+            # Listing files can turn a folder partial, so labels are set last.
+            for entry in dirs:
+                rel = prefix + entry.name
+                tree.item(items[rel], text=folder_label(rel))
+
+        def refresh_labels(item):
+            # Only rows that exist in the tree are relabelled.
+            for child in tree.get_children(item):
+                rel, typ = item_values(child)[:2]
+                if typ == "file":
+                    tree.item(child, text=file_label(rel))
+                elif typ == "dir":
+                    tree.item(child, text=folder_label(rel))
+                    refresh_labels(child)
+
+        def refresh_ancestors(rel):
+            rel = rel.rpartition("/")[0]
+            while rel:
+                tree.item(items[rel], text=folder_label(rel))
+                rel = rel.rpartition("/")[0]
+
+        def load_children(event):
+            item = tree.focus()
+            children = tree.get_children(item)
+            if len(children) == 1 and item_values(children[0])[1:] == ("placeholder",):
+                tree.delete(children[0])
+                rel = item_values(item)[0]
+                insert_items(item, rel)
+                tree.item(item, text=folder_label(rel))
+                refresh_ancestors(rel)
+
+        insert_items('', "")
+        tree.bind("<<TreeviewOpen>>", load_children)
+
+        def update_preview_live(changed):
+            if not self.enable_preview.get() or not changed:
+                return
+            if len(changed) > PREVIEW_PATCH_LIMIT:
+                self.schedule_preview_refresh(selection)
+            else:
+                for path in changed:
+                    self.schedule_preview_refresh(selection, path)
+
+        if self.enable_preview.get() and self.preview_files != selection.paths():
+            self.schedule_preview_refresh(selection)
+
+        def on_box(x, y) -> bool:
+            # The box is the "[x]" that starts each label: the click is on the
+            # label's text, and the text does not reach one box width back.
+            def on_text(x):
+                return tree.identify_element(x, y).endswith("text")
+
+            return on_text(x) and not on_text(x - box_width)
+
+        def walk_once(rel):
+            folder = rel
+            while folder:
+                if folder in walked:
+                    return
+                folder = folder.rpartition("/")[0]
+            for file_rel in walk_folder(selection.root, rules, rel):
+                selection.add(file_rel)
+            walked.add(rel)
 
         def toggle_checkbox(event):
             item = tree.identify_row(event.y)
-            if not item:
+            if not item or not on_box(event.x, event.y):
                 return
-            values = tree.item(item, 'values')
+            values = item_values(item)
             if len(values) < 2:
                 return
-            path_str, typ = values
-            if typ == "file" and path_str in checkbox_vars:
-                var = checkbox_vars[path_str]
-                var.set(not var.get())
-                new_label = f"[{'x' if var.get() else ' '}] {Path(path_str).name}"
-                tree.item(item, text=new_label)
-                update_preview_live()
+            rel, typ = values[:2]
+            if typ == "file":
+                selection.set(rel, not selection.is_checked(rel))
+                tree.item(item, text=file_label(rel))
+                changed = [selection.root / rel]
+            elif typ == "dir":
+                # Files that were never shown count too, so the whole folder is listed first.
+                walk_once(rel)
+                changed = selection.toggle_folder(rel)
+                tree.item(item, text=folder_label(rel))
+                refresh_labels(item)
+            else:
+                return
+            refresh_ancestors(rel)
+            update_preview_live(changed)
 
         tree.bind("<Button-1>", toggle_checkbox)
+        # The second click of a double click, which opens a folder, does not toggle it again.
+        tree.bind("<Double-Button-1>", lambda event: None)
+
+        def confirm():
+            selection.commit()
+            selector.destroy()
+            self.cancel_preview_refresh()
+            if self.preview_window:
+                self.preview_window.destroy()
 
-        ttk.Button(
-            selector,
-            text="Confirm Selection",
-            command=lambda: (
-                self.selected_files.update({Path(p) for p, var in checkbox_vars.items() if var.get()}),
-                selector.destroy(),
-                self.preview_window and self.preview_window.destroy(),
-            ),
-        ).pack(pady=5)
-
-    def get_preview_text(self, included_files):
-        preview_lines = self.generate_preview_lines(self.start_folder.get(), included_files)
-        full_text = "\n".join(preview_lines)
-        token_count = estimate_token_count(full_text)
-        header = f"Token estimate: {token_count}\n{'='*40}\n"
-        return header + full_text
-
-    def generate_preview_lines(self, start_folder, included_files):
-        lines = []
-        project_name = Path(start_folder).name
+        def discard():
+            restored = selection.rollback()
+            selector.destroy()
+            update_preview_live(restored)
+
+        selector.protocol("WM_DELETE_WINDOW", discard)
+        ttk.Button(selector, text="Confirm Selection", command=confirm).pack(pady=5)
+
+    def preview_options(self):
+        """Snapshot of what shapes a file's preview segment: ``(start_folder, heading, fenced)``."""
+        return (
+            self.start_folder.get(),
+            self.include_heading.get(),
+            self.as_markdown.get() and self.use_code_block.get(),
+        )
+
+    def preview_header(self, token_count: int, note: str = "") -> str:
+        # The total adds up per-file counts, so tokens merged across the joins
+        # between files are not seen; it is close to the joined text's count, not equal.
+        return f"{self.token_counter.tokenizer.label}: ≈{token_count}{note}\n{'='*40}\n"
+
+    def preview_project_line(self, start_folder) -> str:
         date_str = datetime.now().strftime('%Y%m%d')
-        lines.append(f"Project: {project_name} - {date_str}\n")
+        return f"Project: {Path(start_folder).name} - {date_str}\n"
 
-        for path in sorted(included_files):
-            try:
-                content = path.read_text(encoding='utf-8', errors='ignore')
-            except Exception:
-                continue
-            rel_path = path.relative_to(start_folder)
-            if self.include_heading.get():
-                lines.append(f"## {rel_path.as_posix()}\n")
-            if self.as_markdown.get() and self.use_code_block.get():
-                lang = LANG_MAP.get(path.suffix, '')
-                lines.append(f"```{lang}\n{content}\n```\n")
-            else:
-                lines.append(f"{content}\n")
+    def count_segment_tokens(self, path: Path, segment: str, options) -> int:
+        # The segment depends on the preview options, so they are part of the
+        # cache key alongside the file stat.
+        return self.token_counter.count_file(path, segment, options)
+
+    def load_tokenizer(self):
+        try:
+            return load_tokenizer(self.settings)
+        except (OSError, ValueError) as e:
+            messagebox.showwarning("Tokenizer", f"Could not load tokenizer vocabulary, using the estimate instead:\n{e}")
+            return EstimateTokenizer()
+
+    def format_preview_file(self, path: Path, content: str, options):
+        start_folder, include_heading, fenced = options
+        lines = []
+        rel_path = path.relative_to(start_folder)
+        if include_heading:
+            lines.append(f"## {rel_path.as_posix()}\n")
+        if fenced:
+            lang = LANG_MAP.get(path.suffix, '')
+            lines.append(f"```{lang}\n{content}\n```\n")
+        else:
+            lines.append(f"{content}\n")
         return lines
 
+    def format_preview_segment(self, path: Path, content: str, options):
+        """Text a file contributes to the joined preview, leading separator included."""
+        with tracer.span("format"):
+            return "\n" + "\n".join(self.format_preview_file(path, content, options))
+
     def generate(self):
         if not self.start_folder.get() or not self.dest_folder.get():
             messagebox.showerror("Error", "Please select both source and destination folders")
@@ -465,15 +1080,65 @@ class PromptPackApp:
         if not self.selected_files:
             messagebox.showerror("Error", "No files selected")
             return
-        try:
-            output_path = generate_output(
-                self.start_folder.get(),
-                self.dest_folder.get(),
-                list(self.selected_files),
-                self.as_markdown.get(),
-                self.include_heading.get(),
-                self.use_code_block.get(),
-            )
-            messagebox.showinfo("Done", f"File generated: {output_path}")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        max_tokens = self.parse_max_tokens()
+        if max_tokens is None:
+            messagebox.showerror("Error", "Token budget must be a whole number (empty or 0 to disable)")
+            return
+        self.settings["max_tokens"] = max_tokens
+        report = {}
+        files = sorted(self.selected_files)
+        args = (
+            self.start_folder.get(),
+            self.dest_folder.get(),
+            files,
+            self.as_markdown.get(),
+            self.include_heading.get(),
+            self.use_code_block.get(),
+        )
+        kwargs = {
+            "workers": self.settings["read_workers"],
+            "max_tokens": max_tokens,
+            "priorities": list(self.settings["budget_priorities"]),
+            "token_counter": self.token_counter,
+            "dedupe": self.dedupe.get(),
+            "split_tokens": self.settings["split_max_tokens"],
+            "split_bytes": self.settings["split_max_bytes"],
+            "report": report,
+        }
+        self.run_job(
+            "Generating",
+            lambda cancel, progress: generate_output(*args, **kwargs, cancel=cancel, progress=progress),
+            lambda output_path: messagebox.showinfo("Done", f"File generated: {output_path}{self.format_report(report)}"),
+            total=len(files),
+        )
+
+    def parse_max_tokens(self):
+        value = self.max_tokens.get().strip()
+        if not value:
+            return 0
+        return int(value) if value.isdigit() else None
+
+    def format_report(self, report, limit: int = 10) -> str:
+        lines = []
+        if "tokens" in report:
+            lines.append(f"{self.token_counter.tokenizer.label}: {report['tokens']}")
+        if "parts" in report:
+            lines.append(f"Written as {len(report['parts'])} part(s) in {Path(report['parts'][0]).parent}")
+        dropped = report.get("dropped", [])
+        if dropped:
+            lines.append(f"Dropped {len(dropped)} file(s) to fit the token budget:")
+            for path, reason in dropped[:limit]:
+                lines.append(f"  {path.relative_to(self.start_folder.get()).as_posix()}: {reason}")
+            if len(dropped) > limit:
+                lines.append(f"  ... and {len(dropped) - limit} more")
+        duplicates = report.get("duplicates", [])
+        if duplicates:
+            lines.append(f"Deduplicated {len(duplicates)} file(s), saving {format_size(report['saved_bytes'])}")
+        skipped = report.get("skipped", [])
+        if skipped:
+            lines.append(f"Skipped {len(skipped)} file(s):")
+            for path, reason in skipped[:limit]:
+                lines.append(f"  {path.relative_to(self.start_folder.get()).as_posix()}: {reason}")
+            if len(skipped) > limit:
+                lines.append(f"  ... and {len(skipped) - limit} more")
+        return "".join("\n" + line for line in lines)
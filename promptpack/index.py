@@ -0,0 +1,288 @@
+"""Persistent per-project file index.
+
+The index is a SQLite database in the user cache directory. It records every
+file under a project, whether it passes the selection rules, and any cached
+token counts. On the next scan only directories whose ``st_mtime_ns``
+changed are listed again; unchanged directories are trusted as-is, so
+reopening a large unchanged project costs one ``stat`` per directory rather
+than a full walk.
+
+A directory's mtime changes when entries are added, removed or renamed, not
+when a file's contents change. Anything that depends on contents, such as
+token counts, is therefore validated against a fresh ``stat`` of the file.
+``.gitignore`` files are the exception: their size and mtime are recorded,
+and when one is edited, added or removed the index is rebuilt, since the
+rules can reach any subfolder.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from .trace import tracer
+from .rules import IGNORE_FILE, SelectionRules
+from .utils import check_cancel, default_selected_names
+
+SCHEMA_VERSION = "2"
+COMMIT_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, valid INTEGER) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE TABLE IF NOT EXISTS tokens (
+    key TEXT PRIMARY KEY, tokenizer TEXT, size INTEGER, mtime_ns INTEGER, count INTEGER
+);
+"""
+
+
+def cache_dir() -> Path:
+    """Directory holding the index databases, overridable with ``PROMPTPACK_CACHE_DIR``."""
+    override = os.environ.get("PROMPTPACK_CACHE_DIR")
+    if override:
+        return Path(override)
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        return Path(os.environ["LOCALAPPDATA"]) / "PromptPack" / "cache"
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "promptpack"
+
+
+def _join(rel: str, name: str) -> str:
+    return f"{rel}/{name}" if rel else name
+
+
+def _parent(rel: str) -> str:
+    return rel.rpartition("/")[0]
+
+
+class ProjectIndex:
+    def __init__(self, root, settings, directory=None):
+        # Returned paths are built on ``root`` as given so they compare equal
+        # to paths from the file tree; the database is keyed on the real path.
+        self.root = Path(root)
+        self.real_root = self.root.resolve()
+        self.settings = settings
+        self.rules = SelectionRules(settings, self.root)
+        directory = Path(directory) if directory else cache_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha1(str(self.real_root).encode("utf-8")).hexdigest()[:16]
+        self.db_path = directory / f"{self.real_root.name}-{digest}.sqlite"
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        self.db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._check_meta()
+        self.dirs_rescanned = 0
+        self.files_rescanned = 0
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _check_meta(self):
+        # Rule order matters once negations are allowed, so lists are not sorted.
+        dir_rules = json.dumps([self.settings["excluded_dirs"], self.rules.use_gitignore])
+        file_rules = json.dumps([sorted(self.settings["allowed_exts"]), self.settings["excluded_files"]])
+        with self.db:
+            if self._meta("schema") != SCHEMA_VERSION or self._meta("root") != str(self.real_root) \
+                    or self._meta("dir_rules") != dir_rules:
+                # Pruning rules decide which directories exist in the index at
+                # all, so a change there invalidates everything.
+                self._clear()
+            elif self._meta("file_rules") != file_rules:
+                rows = self.db.execute("SELECT path FROM files").fetchall()
+                self.db.executemany(
+                    "UPDATE files SET valid = ? WHERE path = ?",
+                    ((int(self.rules.selects_path(p)), p) for (p,) in rows),
+                )
+            self._set_meta("schema", SCHEMA_VERSION)
+            self._set_meta("root", str(self.real_root))
+            self._set_meta("dir_rules", dir_rules)
+            self._set_meta("file_rules", file_rules)
+
+    def _clear(self):
+        self.db.execute("DELETE FROM dirs")
+        self.db.execute("DELETE FROM files")
+        self._ignore_files = {}
+        self._set_meta("ignore_files", "{}")
+
+    def _ignore_file_state(self, rel):
+        try:
+            st = os.stat(os.path.join(self.root, rel, IGNORE_FILE))
+        except OSError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def _ignore_files_changed(self) -> bool:
+        """Whether a recorded ``.gitignore`` was edited or removed since the last scan."""
+        return any(self._ignore_file_state(rel) != state for rel, state in self._ignore_files.items())
+
+    def scan(self, cancel=None, progress=None):
+        """Bring the index up to date and return the default selection as POSIX paths relative to the root.
+
+        On Python 3.11 building a ``Path`` per file costs more than the whole
+        warm scan, so names are returned as they are stored.
+        """
+        with tracer.span("scan") as span:
+            names = self._scan(cancel, progress)
+            span.add(files=len(names))
+        return names
+
+    def _scan(self, cancel=None, progress=None):
+        # Scopes cache the .gitignore rules they read, so each scan starts afresh.
+        self.rules = SelectionRules(self.settings, self.root)
+        self._ignore_files = json.loads(self._meta("ignore_files") or "{}")
+        if self._ignore_files_changed():
+            with self.db:
+                self._clear()
+        known_dirs = dict(self.db.execute("SELECT path, mtime_ns FROM dirs"))
+        children = {}
+        for path, parent in self.db.execute("SELECT path, parent FROM dirs WHERE path != ''"):
+            children.setdefault(parent, []).append(path)
+
+        self.dirs_rescanned = 0
+        self.files_rescanned = 0
+        self._rebuild = False
+        seen = set()
+        stack = [""]
+        with self._lock, self.db:
+            while stack:
+                check_cancel(cancel)
+                rel = stack.pop()
+                abs_dir = os.path.join(self.root, rel) if rel else str(self.root)
+                try:
+                    mtime_ns = os.stat(abs_dir).st_mtime_ns
+                except OSError:
+                    continue
+                seen.add(rel)
+                if known_dirs.get(rel) == mtime_ns:
+                    stack.extend(children.get(rel, ()))
+                    continue
+                stack.extend(self._rescan_dir(rel, abs_dir, mtime_ns, rel in known_dirs))
+                self.dirs_rescanned += 1
+                if progress is not None:
+                    progress(self.files_rescanned, 0)
+                if self._rebuild:
+                    break
+
+            # Directories that disappeared, together with their files.
+            gone = [d for d in known_dirs if d not in seen]
+            self.db.executemany("DELETE FROM dirs WHERE path = ?", ((d,) for d in gone))
+            self.db.executemany("DELETE FROM files WHERE dir = ?", ((d,) for d in gone))
+            for d in gone:
+                self._ignore_files.pop(d, None)
+
+            if self._rebuild:
+                # A .gitignore appeared in a folder whose subfolders were
+                # trusted from the last scan, so start over from scratch.
+                self._clear()
+            else:
+                self._set_meta("ignore_files", json.dumps(self._ignore_files))
+                rows = self.db.execute("SELECT path FROM files WHERE valid = 1").fetchall()
+        if self._rebuild:
+            return self._scan(cancel, progress)
+        return [p for (p,) in rows]
+
+    def _rescan_dir(self, rel, abs_dir, mtime_ns, known):
+        subdirs = []
+        files = []
+        try:
+            with os.scandir(abs_dir) as it:
+                entries = list(it)
+        except OSError:
+            return []
+        has_ignore_file = any(entry.name == IGNORE_FILE for entry in entries)
+        if self.rules.use_gitignore:
+            state = self._ignore_file_state(rel) if has_ignore_file else None
+            if state != self._ignore_files.get(rel):
+                if known:
+                    self._rebuild = True
+                    return []
+                if state is None:
+                    self._ignore_files.pop(rel, None)
+                else:
+                    self._ignore_files[rel] = state
+        scope = self.rules.scope(rel, has_ignore_file)
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not self.rules.prunes(scope, rel, entry.name):
+                        subdirs.append(_join(rel, entry.name))
+                elif entry.is_file():
+                    files.append((_join(rel, entry.name), rel, int(self.rules.selects(scope, rel, entry.name))))
+            except OSError:
+                continue
+
+        if known:
+            names = {f[0] for f in files}
+            stale = [p for (p,) in self.db.execute("SELECT path FROM files WHERE dir = ?", (rel,)) if p not in names]
+            self.db.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in stale))
+        self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", files)
+        self.files_rescanned += len(files)
+        self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (rel, _parent(rel) if rel else None, mtime_ns))
+        return subdirs
+
+    def dir_mtimes(self):
+        """``{relative folder: st_mtime_ns}`` for every folder recorded by the last scan."""
+        with self._lock:
+            return dict(self.db.execute("SELECT path, mtime_ns FROM dirs"))
+
+    def get_tokens(self, key: str, tokenizer: str, size: int, mtime_ns: int):
+        with self._lock:
+            row = self.db.execute(
+                "SELECT count FROM tokens WHERE key = ? AND tokenizer = ? AND size = ? AND mtime_ns = ?",
+                (key, tokenizer, size, mtime_ns),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_tokens(self, key: str, tokenizer: str, size: int, mtime_ns: int, count: int):
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?, ?)",
+                (key, tokenizer, size, mtime_ns, count),
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= COMMIT_EVERY:
+                self.db.commit()
+                self._pending_writes = 0
+
+    def flush(self):
+        with self._lock:
+            self.db.commit()
+            self._pending_writes = 0
+
+    def close(self):
+        with self._lock:
+            self.db.commit()
+            self.db.close()
+
+
+def scan_project(folder, settings, cancel=None, progress=None):
+    """Default selection for ``folder``, through the index when ``use_index`` is set.
+
+    With ``use_git_index`` the files tracked by git are listed instead of
+    walking the folder, unless ``folder`` is not in a git repository.
+    Returns ``(index, names)`` with POSIX paths relative to ``folder``;
+    ``index`` is None when the index is disabled or git is used.
+    """
+    if settings.get("use_git_index"):
+        from .git import GitError, tracked_selection
+
+        try:
+            with tracer.span("scan") as span:
+                names = tracked_selection(folder, settings)
+                span.add(files=len(names))
+            return None, names
+        except GitError:
+            pass
+    if settings.get("use_index"):
+        index = ProjectIndex(folder, settings)
+        return index, index.scan(cancel, progress)
+    return None, default_selected_names(folder, settings, cancel, progress)
@@ -0,0 +1,213 @@
+"""HTML rendering for Preview in browser.
+
+Each file's segment of the preview is rendered to HTML on its own and cached
+by a hash of its Markdown text, which already includes the heading and the
+fence language, so toggling one file or reopening the browser preview only
+highlights what changed. The fragments are stitched into pages of at most
+``PAGE_BYTES``; a large selection becomes a set of linked pages with an
+index instead of one huge file that the browser struggles to load.
+"""
+import hashlib
+import html
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import markdown
+
+from .trace import tracer
+
+EXTENSIONS = ("fenced_code", "codehilite")
+PAGE_BYTES = 2 * 1024 * 1024
+
+DARK_CSS = """
+<style>
+body {
+    background-color: #1e1e1e;
+    color: #d4d4d4;
+    font-family: sans-serif;
+    padding: 20px;
+}
+pre, code {
+    background-color: #2d2d2d;
+    color: #dcdcdc;
+    font-family: monospace;
+    padding: 5px;
+    border-radius: 5px;
+    overflow-x: auto;
+    white-space: pre;
+    word-break: normal;
+    line-height: 1.4;
+}
+
+h2 {
+    color: #569cd6;
+}
+a {
+    color: #9cdcfe;
+}
+</style>
+"""
+
+LIGHT_CSS = """
+<style>
+body {
+    background-color: #ffffff;
+    color: #000000;
+    font-family: sans-serif;
+    padding: 20px;
+}
+pre, code {
+    background-color: #f5f5f5;
+    color: #000000;
+    font-family: monospace;
+    padding: 5px;
+    border-radius: 5px;
+    overflow-x: auto;
+    white-space: pre;
+    word-break: normal;
+    line-height: 1.4;
+}
+
+h2 {
+    color: #003366;
+}
+</style>
+"""
+
+
+class RenderCache:
+    """LRU cache of rendered HTML fragments, bounded by their total size."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def put(self, key, fragment: str):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            if len(fragment) > self.max_bytes:
+                return
+            self._entries[key] = fragment
+            self._bytes += len(fragment)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
+
+
+render_cache = RenderCache()
+tracer.register_cache("render cache", render_cache)
+
+# Building a Markdown instance loads its extensions, which costs more than
+# converting a small file, so each thread keeps one and resets it.
+_local = threading.local()
+
+
+def render_markdown(text: str, cache: RenderCache = None) -> str:
+    cache = cache or render_cache
+    key = (hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest(), EXTENSIONS)
+    fragment = cache.get(key)
+    if fragment is None:
+        md = getattr(_local, "md", None)
+        if md is None:
+            md = _local.md = markdown.Markdown(extensions=list(EXTENSIONS))
+        with tracer.span("render", files=1, bytes=len(text)):
+            fragment = md.reset().convert(text)
+        cache.put(key, fragment)
+    return fragment
+
+
+def page_name(number: int) -> str:
+    return f"page-{number:03d}.html"
+
+
+def write_html_pages(header, segments, theme: str = "dark", directory=None, page_bytes: int = PAGE_BYTES, cache: RenderCache = None):
+    """Render ``segments`` into one or more HTML pages and return the page to open.
+
+    ``segments`` yields ``(title, markdown_text)`` and is consumed lazily;
+    ``header`` is called once they are exhausted and returns the Markdown
+    shown at the top of the first page, so it can include totals gathered
+    while rendering. Pages after the first are written as soon as they fill.
+    With more than one page an ``index.html`` listing every file is written
+    and returned.
+    """
+    directory = directory or tempfile.mkdtemp(prefix="promptpack-preview-")
+    css = DARK_CSS if theme == "dark" else LIGHT_CSS
+    first_page = None
+    current = []
+    current_bytes = 0
+    number = 1
+    contents = []
+
+    def page_html(number, body, has_next):
+        nav = []
+        if number > 1:
+            nav.append(f'<a href="{page_name(number - 1)}">&larr; Previous</a>')
+        if number > 1 or has_next:
+            nav.append('<a href="index.html">Index</a>')
+        if has_next:
+            nav.append(f'<a href="{page_name(number + 1)}">Next &rarr;</a>')
+        nav_html = f"<p>{' | '.join(nav)}</p>" if nav else ""
+        return f"<html><head><meta charset=\"utf-8\">{css}</head><body>{nav_html}{body}{nav_html}</body></html>"
+
+    def write_page(number, body, has_next):
+        with open(os.path.join(directory, page_name(number)), "w", encoding="utf-8") as f:
+            f.write(page_html(number, body, has_next))
+
+    for title, text in segments:
+        fragment = render_markdown(text, cache)
+        if current and current_bytes + len(fragment) > page_bytes:
+            # Page one waits for the header, which is only known at the end.
+            if number == 1:
+                first_page = current
+            else:
+                write_page(number, "".join(current), True)
+            number += 1
+            current = []
+            current_bytes = 0
+        current.append(fragment)
+        current_bytes += len(fragment)
+        contents.append((title, number))
+
+    header_html = render_markdown(header(), cache)
+    if number == 1:
+        write_page(1, header_html + "".join(current), False)
+        return os.path.join(directory, page_name(1))
+
+    write_page(number, "".join(current), False)
+    write_page(1, header_html + "".join(first_page), True)
+    items = "".join(
+        f'<li><a href="{page_name(page)}">{html.escape(title)}</a> <small>(page {page})</small></li>'
+        for title, page in contents
+    )
+    with open(os.path.join(directory, "index.html"), "w", encoding="utf-8") as f:
+        f.write(
+            f"<html><head><meta charset=\"utf-8\">{css}</head><body>{header_html}"
+            f"<p>{len(contents)} files on {number} pages.</p><ul>{items}</ul></body></html>"
+        )
+    return os.path.join(directory, "index.html")
@@ -0,0 +1,270 @@
+"""Selection rules compiled from gitignore-style patterns.
+
+``excluded_dirs`` and ``excluded_files`` entries, and the lines of the
+project's ``.gitignore`` files, use the ``.gitignore`` syntax: ``*``, ``?``
+and ``[...]`` globs, ``**`` across folders, a leading ``!`` to re-include,
+a trailing ``/`` for folders only, and a leading or inner ``/`` to anchor
+the pattern to the folder holding it. A plain name such as ``node_modules``
+still matches at any depth.
+
+Rules are compiled once per folder that adds a ``.gitignore``: patterns
+without wildcards go into dicts keyed by name or path, ``*.ext``-style
+patterns into dicts keyed by suffix, and the rest into one regex per kind,
+so checking a path costs a few dict lookups and at most two regex matches
+however many rules there are. As in git, the last matching rule wins: the
+settings come after the ``.gitignore`` files, and deeper ``.gitignore``
+files after shallower ones.
+"""
+import os
+import re
+from collections import namedtuple
+
+IGNORE_FILE = ".gitignore"
+
+_GLOB_CHARS = frozenset("*?[\\")
+
+# ``key`` is tested against the name (unanchored rules at the project root)
+# or the relative path (everything else). ``kind`` is "literal" when ``key``
+# must equal it, "suffix" when a name must end with it, or "regex".
+Rule = namedtuple("Rule", ["negate", "dir_only", "by_path", "kind", "key"])
+
+
+def _translate(pattern: str) -> str:
+    """Regex source for a glob, where ``*`` and ``?`` stay within one path component."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/") \
+                    and (i + 2 == n or pattern[i + 2] == "/"):
+                if i + 2 == n:
+                    out.append(".*")
+                    i += 2
+                else:
+                    # "**/" matches zero or more folders.
+                    out.append("(?:.*/)?")
+                    i += 3
+                continue
+            while i < n and pattern[i] == "*":
+                i += 1
+            out.append("[^/]*")
+            continue
+        if c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i + 1
+            if j < n and pattern[j] in "!^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+            else:
+                body = pattern[i + 1:j].replace("\\", "\\\\").replace("[", "\\[")
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def parse_rule(line: str, base: str = ""):
+    """Compile one ``.gitignore`` line found in folder ``base`` (relative, POSIX), or None for blanks and comments."""
+    line = line.rstrip("\n\r")
+    # Trailing spaces are ignored unless escaped.
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "
+    line = stripped
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    elif line.startswith(("\\!", "\\#")):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    anchored = "/" in line
+    line = line.lstrip("/")
+    by_path = anchored or bool(base)
+    prefix = f"{base}/" if base else ""
+    if not _GLOB_CHARS.intersection(line):
+        if not by_path:
+            return Rule(negate, dir_only, False, "literal", line)
+        if anchored:
+            return Rule(negate, dir_only, True, "literal", prefix + line)
+    elif not by_path and line.startswith("*") and not _GLOB_CHARS.intersection(line[1:]):
+        return Rule(negate, dir_only, False, "suffix", line[1:])
+    regex = _translate(line)
+    if by_path:
+        regex = re.escape(prefix) + ("" if anchored else "(?:.*/)?") + regex
+    return Rule(negate, dir_only, by_path, "regex", regex)
+
+
+def parse_rules(lines, base: str = ""):
+    return [rule for rule in (parse_rule(line, base) for line in lines) if rule is not None]
+
+
+def read_ignore_file(path, base: str = ""):
+    """Rules from one ``.gitignore`` file, or an empty list if it cannot be read."""
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return parse_rules(f, base)
+    except OSError:
+        return []
+
+
+class Matcher:
+    """Answers whether a path is excluded by an ordered list of rules."""
+
+    def __init__(self, rules):
+        self.negated = [rule.negate for rule in rules]
+        self.names = {}
+        self.paths = {}
+        # Suffix length -> {suffix: rule index}; few distinct lengths in practice.
+        self.suffixes = {}
+        name_rules = []
+        path_rules = []
+        for index, rule in enumerate(rules):
+            # Later rules overwrite earlier ones in the dicts, keeping the last match.
+            if rule.kind == "literal":
+                (self.paths if rule.by_path else self.names)[rule.key] = index
+            elif rule.kind == "suffix":
+                self.suffixes.setdefault(len(rule.key), {})[rule.key] = index
+            else:
+                (path_rules if rule.by_path else name_rules).append((index, rule.key))
+        self.name_regex, self.name_order = self._combine(name_rules)
+        self.path_regex, self.path_order = self._combine(path_rules)
+        self.needs_path = bool(self.paths or path_rules)
+        self.empty = not rules
+
+    @staticmethod
+    def _combine(rules):
+        if not rules:
+            return None, ()
+        # Alternatives are tried left to right, so listing the later rules
+        # first makes the matching group the last rule that matches.
+        rules = rules[::-1]
+        regex = re.compile("(?:" + "|".join(f"({key})" for _, key in rules) + ")\\Z", re.DOTALL)
+        return regex, [index for index, _ in rules]
+
+    def excluded(self, name: str, path: str = None) -> bool:
+        """``path`` is the POSIX path relative to the project root; it is only needed when :attr:`needs_path`."""
+        if self.empty:
+            return False
+        best = self.names.get(name, -1)
+        for length, table in self.suffixes.items():
+            index = table.get(name[-length:] if length else "", -1)
+            if index > best:
+                best = index
+        if self.name_regex is not None:
+            m = self.name_regex.match(name)
+            if m is not None:
+                best = max(best, self.name_order[m.lastindex - 1])
+        if self.needs_path:
+            best = max(best, self.paths.get(path, -1))
+            if self.path_regex is not None:
+                m = self.path_regex.match(path)
+                if m is not None:
+                    best = max(best, self.path_order[m.lastindex - 1])
+        return best >= 0 and not self.negated[best]
+
+
+class Scope:
+    """The compiled rules in effect inside one folder."""
+
+    __slots__ = ("git_rules", "dirs", "files")
+
+    def __init__(self, git_rules, dir_rules, file_rules):
+        self.git_rules = git_rules
+        self.dirs = Matcher(git_rules + dir_rules)
+        self.files = Matcher([rule for rule in git_rules if not rule.dir_only] + file_rules)
+
+
+def _join(rel: str, name: str) -> str:
+    return f"{rel}/{name}" if rel else name
+
+
+class SelectionRules:
+    """Which folders a scan prunes and which files it selects below ``root``.
+
+    ``root`` may be None to apply only the settings, without ``.gitignore``
+    files. Scopes are cached per folder, so a full walk reads each
+    ``.gitignore`` once.
+    """
+
+    def __init__(self, settings, root=None):
+        self.allowed_exts = frozenset(settings["allowed_exts"])
+        self.root = os.fspath(root) if root is not None else None
+        self.use_gitignore = self.root is not None and settings.get("use_gitignore", True)
+        self._dir_rules = parse_rules(settings["excluded_dirs"])
+        self._file_rules = [rule for rule in parse_rules(settings["excluded_files"]) if not rule.dir_only]
+        self._scopes = {}
+        self._kept = {}
+
+    def scope(self, rel: str, has_ignore_file: bool = None) -> Scope:
+        """Scope for folder ``rel``; ``has_ignore_file`` saves a ``stat`` when the caller has listed the folder."""
+        scope = self._scopes.get(rel)
+        if scope is not None:
+            return scope
+        if rel:
+            parent = self.scope(rel.rpartition("/")[0])
+        else:
+            parent = None
+        rules = []
+        if self.use_gitignore:
+            path = os.path.join(self.root, rel, IGNORE_FILE)
+            if has_ignore_file is None:
+                has_ignore_file = os.path.isfile(path)
+            if has_ignore_file:
+                rules = read_ignore_file(path, rel)
+        if parent is not None and not rules:
+            scope = parent
+        else:
+            scope = Scope((parent.git_rules if parent else []) + rules, self._dir_rules, self._file_rules)
+        self._scopes[rel] = scope
+        return scope
+
+    def prunes(self, scope: Scope, rel: str, name: str) -> bool:
+        """Whether folder ``name`` inside folder ``rel`` is skipped, contents and all."""
+        matcher = scope.dirs
+        return matcher.excluded(name, _join(rel, name) if matcher.needs_path else None)
+
+    def selects(self, scope: Scope, rel: str, name: str) -> bool:
+        """Whether file ``name`` inside folder ``rel`` is included by default."""
+        if os.path.splitext(name)[1] not in self.allowed_exts:
+            return False
+        matcher = scope.files
+        return not matcher.excluded(name, _join(rel, name) if matcher.needs_path else None)
+
+    def selects_path(self, rel: str) -> bool:
+        """:meth:`selects` for a relative POSIX path; ancestors are not checked for pruning."""
+        folder, _, name = rel.rpartition("/")
+        return self.selects(self.scope(folder), folder, name)
+
+    def includes(self, rel: str) -> bool:
+        """Whether a scan would select ``rel``: no folder on its way is pruned and the file is selected."""
+        folder, _, name = rel.rpartition("/")
+        if not self._folder_kept(folder):
+            return False
+        return self.selects(self.scope(folder), folder, name)
+
+    def _folder_kept(self, folder: str) -> bool:
+        kept = self._kept.get(folder)
+        if kept is None:
+            parent, _, name = folder.rpartition("/")
+            kept = not folder or (self._folder_kept(parent) and not self.prunes(self.scope(parent), parent, name))
+            self._kept[folder] = kept
+        return kept
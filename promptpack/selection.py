@@ -0,0 +1,223 @@
+"""Checked state of a project's files for the file selector.
+
+Files are interned as relative POSIX paths to integer ids, and their checked
+state lives in a ``bytearray`` indexed by id. Every folder keeps the number
+of known files below it and how many of them are checked, so a folder's
+tri-state box is a lookup, and toggling a folder touches only its own
+subtree. The model knows the files from the scan plus any file shown in
+the selector or below a folder toggled there, so its size follows the
+default selection and the folders the user worked in, not the size of the
+tree.
+
+Edits between :meth:`SelectionModel.begin` and :meth:`SelectionModel.commit`
+are journaled, so confirming costs nothing per file and cancelling costs
+one step per changed file.
+
+The model reads like a set of absolute ``Path`` objects (``in``, ``len``,
+iteration), which is how the rest of the app consumes the selection.
+"""
+import os
+from pathlib import Path
+
+CHECKED = "checked"
+PARTIAL = "partial"
+UNCHECKED = "unchecked"
+
+
+def _parent(rel: str) -> str:
+    return rel.rpartition("/")[0]
+
+
+class SelectionModel:
+    def __init__(self, root, checked=()):
+        self.root = Path(root)
+        self._prefix = os.path.join(os.fspath(root), "")
+        self._ids = {}
+        self._rels = []
+        self._paths = []
+        self._state = bytearray()
+        self._checked = 0
+        # Folder -> [known files below it, checked files below it].
+        self._counts = {"": [0, 0]}
+        self._files = {}
+        self._subdirs = {}
+        self._journal = None
+        self._add_checked(checked)
+
+    def _add_checked(self, paths):
+        # Bulk :meth:`add` for the initial selection into an empty model:
+        # files are interned in one pass and folder counts propagated once
+        # per folder.
+        ids, rels, files = self._ids, self._rels, self._files
+        prefix = self._prefix
+        for path in paths:
+            if isinstance(path, str):
+                rel = path[len(prefix):] if path.startswith(prefix) else path
+                if os.sep != "/":
+                    rel = rel.replace(os.sep, "/")
+                path = None
+            else:
+                rel = self.relative(path)
+                if not isinstance(path, Path):
+                    path = None
+            if rel in ids:
+                continue
+            file_id = ids[rel] = len(rels)
+            rels.append(rel)
+            self._paths.append(path)
+            folder = rel.rpartition("/")[0]
+            folder_files = files.get(folder)
+            if folder_files is None:
+                folder_files = files[folder] = []
+            folder_files.append(file_id)
+        added = len(rels) - len(self._state)
+        self._state.extend(b"\x01" * added)
+        self._checked += added
+        for folder, folder_files in list(files.items()):
+            self._add_folder(folder)
+            count = len(folder_files)
+            while True:
+                counts = self._counts[folder]
+                counts[0] += count
+                counts[1] += count
+                if not folder:
+                    break
+                folder = _parent(folder)
+
+    def relative(self, path) -> str:
+        """POSIX path of ``path`` relative to the root; ``path`` may already be relative."""
+        path = os.fspath(path)
+        if path.startswith(self._prefix):
+            path = path[len(self._prefix):]
+        return path.replace(os.sep, "/") if os.sep != "/" else path
+
+    def _add_folder(self, folder: str):
+        while folder not in self._counts:
+            self._counts[folder] = [0, 0]
+            parent = _parent(folder)
+            self._subdirs.setdefault(parent, []).append(folder)
+            folder = parent
+
+    def add(self, rel: str, checked: bool = False) -> int:
+        """Intern ``rel`` as a known file and return its id; its state is kept if already known."""
+        file_id = self._ids.get(rel)
+        if file_id is not None:
+            return file_id
+        file_id = self._ids[rel] = len(self._rels)
+        self._rels.append(rel)
+        self._paths.append(None)
+        self._state.append(checked)
+        folder = _parent(rel)
+        self._add_folder(folder)
+        self._files.setdefault(folder, []).append(file_id)
+        self._checked += checked
+        while True:
+            counts = self._counts[folder]
+            counts[0] += 1
+            counts[1] += checked
+            if not folder:
+                break
+            folder = _parent(folder)
+        return file_id
+
+    def _path(self, file_id: int) -> Path:
+        path = self._paths[file_id]
+        if path is None:
+            path = self._paths[file_id] = self.root / self._rels[file_id]
+        return path
+
+    def __contains__(self, path) -> bool:
+        file_id = self._ids.get(self.relative(path))
+        return file_id is not None and bool(self._state[file_id])
+
+    def __len__(self) -> int:
+        return self._checked
+
+    def __iter__(self):
+        state = self._state
+        return (self._path(file_id) for file_id in range(len(state)) if state[file_id])
+
+    def paths(self) -> set:
+        return set(self)
+
+    def is_checked(self, rel: str) -> bool:
+        file_id = self._ids.get(rel)
+        return file_id is not None and bool(self._state[file_id])
+
+    def folder_state(self, folder: str) -> str:
+        total, checked = self._counts.get(folder, (0, 0))
+        if checked == 0:
+            return UNCHECKED
+        return CHECKED if checked == total else PARTIAL
+
+    def _set_id(self, file_id: int, checked: bool) -> bool:
+        if self._state[file_id] == checked:
+            return False
+        if self._journal is not None:
+            self._journal.setdefault(file_id, not checked)
+        self._state[file_id] = checked
+        return True
+
+    def set(self, rel: str, checked: bool) -> bool:
+        """Check or uncheck one file, interning it if needed; returns whether it changed."""
+        file_id = self.add(rel)
+        if not self._set_id(file_id, checked):
+            return False
+        delta = 1 if checked else -1
+        self._checked += delta
+        folder = _parent(rel)
+        while True:
+            self._counts[folder][1] += delta
+            if not folder:
+                break
+            folder = _parent(folder)
+        return True
+
+    def set_folder(self, folder: str, checked: bool):
+        """Check or uncheck every known file below ``folder``; returns the paths that changed."""
+        changed = []
+
+        def visit(current):
+            delta = 0
+            for file_id in self._files.get(current, ()):
+                if self._set_id(file_id, checked):
+                    changed.append(self._path(file_id))
+                    delta += 1
+            for sub in self._subdirs.get(current, ()):
+                delta += visit(sub)
+            self._counts[current][1] += delta if checked else -delta
+            return delta
+
+        if folder not in self._counts:
+            return changed
+        delta = visit(folder)
+        if not checked:
+            delta = -delta
+        self._checked += delta
+        while folder:
+            folder = _parent(folder)
+            self._counts[folder][1] += delta
+        return changed
+
+    def toggle_folder(self, folder: str):
+        """Tri-state toggle: a fully checked folder is cleared, anything else is checked."""
+        return self.set_folder(folder, self.folder_state(folder) != CHECKED)
+
+    def begin(self):
+        """Start journaling edits so they can be committed or rolled back as a whole."""
+        self._journal = {}
+
+    def commit(self):
+        """Keep the journaled edits and return the paths whose state differs from :meth:`begin`."""
+        journal, self._journal = self._journal or {}, None
+        return [self._path(file_id) for file_id, was in journal.items() if self._state[file_id] != was]
+
+    def rollback(self):
+        """Undo the journaled edits and return the paths that were restored."""
+        journal, self._journal = self._journal or {}, None
+        restored = []
+        for file_id, was in journal.items():
+            if self._state[file_id] != was:
+                self.set(self._rels[file_id], was)
+                restored.append(self._path(file_id))
+        return restored
@@ -0,0 +1,584 @@
+"""Long-running local server that keeps projects warm between requests.
+
+``python -m promptpack serve`` answers JSON-RPC 2.0 requests, one JSON
+object per line, on stdin/stdout or, with ``--socket PATH``, on a Unix
+socket. Settings are loaded once. Each project keeps its file selection,
+its index and its token counter, and a content cache per set of file limits
+keeps file contents, so a request on an unchanged project costs a ``stat``
+per selected file instead of a fresh interpreter, a walk and cold reads.
+
+A polling thread watches the modification time of every scanned folder and
+``.gitignore`` file, plus the settings file. A change marks the project
+stale, and its next request scans again, through the index when it is
+enabled, so only the changed folders are listed. Edits to file contents do
+not change folder times; file contents and token counts are checked against
+a fresh ``stat`` on every use instead. With ``use_git_index`` the selection
+is listed from git on every request, since staging changes nothing in the
+tree.
+
+Methods, all taking an object of params with ``src`` (the project folder)
+and an optional ``settings`` object that overrides the settings file:
+
+- ``pack``: writes the output into ``output`` like ``promptpack pack``.
+- ``preview``: returns the output text without writing it.
+- ``count_tokens``: returns per-file and total token counts.
+- ``status`` and ``shutdown`` take no params.
+"""
+import json
+import os
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from .index import scan_project
+from .rules import IGNORE_FILE, SelectionRules
+from .settings import DEFAULT_SETTINGS, SETTINGS_FILE, load_settings
+from .tokenizer import TokenCounter, load_tokenizer
+from .utils import (
+    ContentCache,
+    SkippedFile,
+    duplicate_block,
+    file_block_parts,
+    file_limits,
+    find_duplicates,
+    generate_output,
+    output_header,
+    output_variant,
+)
+
+POLL_INTERVAL = 1.0
+# Projects kept warm at once; the least recently used one is dropped first.
+MAX_PROJECTS = 16
+# Content caches kept at once, one per distinct set of file limits.
+MAX_CONTENT_CACHES = 4
+# Settings that decide which files are selected. Projects are keyed on
+# them; the other settings only shape the output and apply per request.
+SELECTION_KEYS = ("allowed_exts", "excluded_dirs", "excluded_files", "use_gitignore", "use_index", "use_git_index")
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+SERVER_ERROR = -32000
+
+
+class RPCError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _join(rel: str, name: str) -> str:
+    return f"{rel}/{name}" if rel else name
+
+
+def scanned_folders(root, rules: SelectionRules):
+    """Relative paths of the folders a scan of ``root`` visits."""
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        yield rel
+        try:
+            with os.scandir(os.path.join(root, rel)) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        scope = rules.scope(rel, any(entry.name == IGNORE_FILE for entry in entries))
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False) and not rules.prunes(scope, rel, entry.name):
+                    stack.append(_join(rel, entry.name))
+            except OSError:
+                continue
+
+
+def _stat_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class Project:
+    """Warm state of one folder scanned with one set of selection settings."""
+
+    def __init__(self, folder: Path, settings):
+        self.folder = folder
+        self.settings = settings
+        self.index = None
+        self.token_counters = {}
+        self.files = None
+        # Path -> (st_mtime_ns, st_size) when last scanned; None to rescan on every request.
+        self.watch = None
+        self.stale = True
+        self.scans = 0
+        self.lock = threading.Lock()
+        # Requests using the project, and whether it was dropped; both are
+        # guarded by the server's lock. A dropped project is closed by its
+        # last request.
+        self.active = 0
+        self.retired = False
+
+    def selection(self):
+        """The default selection, sorted, scanning again only when the project changed."""
+        with self.lock:
+            if self.stale or self.files is None:
+                if self.index is not None:
+                    names = self.index.scan()
+                else:
+                    self.index, names = scan_project(self.folder, self.settings)
+                self.files = sorted(self.folder / name for name in names)
+                self.scans += 1
+                self.watch = None if self.settings.get("use_git_index") else self._snapshot()
+                self.stale = self.watch is None
+            return self.files
+
+    def counter(self, tokenizer) -> TokenCounter:
+        counter = self.token_counters.get(tokenizer)
+        if counter is None:
+            counter = self.token_counters[tokenizer] = TokenCounter(tokenizer, store=self.index)
+        return counter
+
+    def flush(self):
+        # Token counts reach the index in batches; commit them so that other
+        # processes opening the same index are not locked out meanwhile.
+        if self.index is not None:
+            self.index.flush()
+
+    def _snapshot(self):
+        if self.index is not None:
+            folders = self.index.dir_mtimes()
+        else:
+            folders = scanned_folders(self.folder, SelectionRules(self.settings, self.folder))
+        use_gitignore = self.settings.get("use_gitignore", True)
+        watch = {}
+        for rel in folders:
+            folder = os.path.join(self.folder, rel)
+            watch[folder] = _stat_state(folder)
+            if use_gitignore:
+                # A new .gitignore shows up in its folder's mtime, so only
+                # existing ones are watched for edits.
+                ignore_file = os.path.join(folder, IGNORE_FILE)
+                state = _stat_state(ignore_file)
+                if state is not None:
+                    watch[ignore_file] = state
+        return watch
+
+    def poll(self):
+        """Mark the project stale if a watched folder or ``.gitignore`` changed."""
+        watch = self.watch
+        if self.stale or watch is None:
+            return
+        for path, state in watch.items():
+            if _stat_state(path) != state:
+                self.stale = True
+                return
+
+    def close(self):
+        with self.lock:
+            if self.index is not None:
+                self.index.close()
+                self.index = None
+            self.token_counters = {}
+
+
+class Server:
+    def __init__(self, settings_path=SETTINGS_FILE, poll_interval: float = POLL_INTERVAL):
+        self.settings_path = settings_path
+        self.poll_interval = poll_interval
+        self.projects = OrderedDict()
+        # Dropped projects that requests are still using.
+        self.retiring = set()
+        self.tokenizers = {}
+        # File limits -> content cache; requests never change a cache's limits.
+        self.content_caches = OrderedDict()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self._load_settings()
+
+    def _load_settings(self):
+        self.settings_state = _stat_state(self.settings_path)
+        self.settings = load_settings(self.settings_path)
+        self.content_caches = OrderedDict()
+
+    def poll_forever(self):
+        while not self.stopped.wait(self.poll_interval):
+            self.poll()
+
+    def poll(self):
+        if _stat_state(self.settings_path) != self.settings_state:
+            with self.lock:
+                self._load_settings()
+                projects, self.projects = list(self.projects.values()), OrderedDict()
+            self._retire(projects)
+            return
+        with self.lock:
+            projects = list(self.projects.values())
+        for project in projects:
+            project.poll()
+
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            projects, self.projects = list(self.projects.values()), OrderedDict()
+        self._retire(projects)
+
+    def _retire(self, projects):
+        # Requests may still be using a dropped project's index, so the last
+        # of them closes it.
+        idle = []
+        with self.lock:
+            for project in projects:
+                project.retired = True
+                if project.active:
+                    self.retiring.add(project)
+                else:
+                    idle.append(project)
+        for project in idle:
+            project.close()
+
+    def release(self, project):
+        """End a request on ``project``, closing it if it was dropped meanwhile."""
+        with self.lock:
+            project.active -= 1
+            idle = project.retired and not project.active
+            if idle:
+                self.retiring.discard(project)
+        if idle:
+            project.close()
+
+    def project(self, params):
+        """``(project, settings)`` for a request's ``src`` and ``settings`` params.
+
+        The project counts as in use until it is passed to :meth:`release`.
+        """
+        if not isinstance(params, dict) or not isinstance(params.get("src"), str):
+            raise RPCError(INVALID_PARAMS, "params must be an object with a 'src' folder")
+        folder = Path(params["src"]).resolve()
+        if not folder.is_dir():
+            raise RPCError(INVALID_PARAMS, f"source folder not found: {params['src']}")
+        overrides = params.get("settings") or {}
+        if not isinstance(overrides, dict):
+            raise RPCError(INVALID_PARAMS, "'settings' must be an object")
+        unknown = sorted(set(overrides) - set(DEFAULT_SETTINGS))
+        if unknown:
+            raise RPCError(INVALID_PARAMS, f"unknown settings: {', '.join(unknown)}")
+        with self.lock:
+            settings = dict(self.settings, **overrides)
+            key = (str(folder), json.dumps([settings[name] for name in SELECTION_KEYS]))
+            project = self.projects.get(key)
+            if project is not None:
+                self.projects.move_to_end(key)
+                project.active += 1
+                return project, settings
+            selection = {name: settings[name] for name in SELECTION_KEYS}
+            others = list(self.projects.values()) + list(self.retiring)
+            if any(other.folder == folder and other.settings["use_index"] for other in others):
+                # The index is one database per folder, kept in step with one
+                # set of rules, so other rules for the same folder walk it.
+                selection["use_index"] = False
+            project = self.projects[key] = Project(folder, selection)
+            project.active += 1
+            evicted = self.projects.popitem(last=False)[1] if len(self.projects) > MAX_PROJECTS else None
+        if evicted is not None:
+            self._retire([evicted])
+        return project, settings
+
+    def content_cache(self, settings) -> ContentCache:
+        """Content cache for the file limits in ``settings``, shared by every request with the same limits."""
+        limits = file_limits(settings)
+        with self.lock:
+            cache = self.content_caches.get(limits)
+            if cache is None:
+                cache = self.content_caches[limits] = ContentCache(self.settings["cache_max_bytes"], limits)
+                if len(self.content_caches) > MAX_CONTENT_CACHES:
+                    self.content_caches.popitem(last=False)
+            else:
+                self.content_caches.move_to_end(limits)
+        return cache
+
+    def tokenizer(self, settings):
+        # Loading a BPE vocabulary is the slow part, so it is shared by every project.
+        vocab = settings["tokenizer_vocab"]
+        tokenizer = self.tokenizers.get(vocab)
+        if tokenizer is None:
+            try:
+                tokenizer = self.tokenizers[vocab] = load_tokenizer(settings)
+            except (OSError, ValueError) as e:
+                raise RPCError(SERVER_ERROR, f"cannot load tokenizer: {e}")
+        return tokenizer
+
+    def handle(self, line: str):
+        """Response line for one request line, or None for notifications."""
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return json.dumps(self._error(None, RPCError(PARSE_ERROR, "parse error")))
+        if isinstance(message, list):
+            if not message:
+                return json.dumps(self._error(None, RPCError(INVALID_REQUEST, "empty batch")))
+            responses = [r for r in map(self._respond, message) if r is not None]
+            return json.dumps(responses) if responses else None
+        response = self._respond(message)
+        return json.dumps(response) if response is not None else None
+
+    def _respond(self, message):
+        if not isinstance(message, dict) or message.get("jsonrpc") != "2.0" or not isinstance(message.get("method"), str):
+            return self._error(message.get("id") if isinstance(message, dict) else None,
+                               RPCError(INVALID_REQUEST, "invalid request"))
+        request_id = message.get("id")
+        method = getattr(self, "rpc_" + message["method"], None)
+        try:
+            if method is None:
+                raise RPCError(METHOD_NOT_FOUND, f"unknown method: {message['method']}")
+            self.requests += 1
+            result = method(message.get("params") or {})
+        except RPCError as e:
+            error = e
+        except (OSError, ValueError) as e:
+            error = RPCError(SERVER_ERROR, str(e))
+        except Exception as e:
+            # A bad request must not take the server down.
+            error = RPCError(INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+        else:
+            if "id" not in message:
+                return None
+            return {"jsonrpc": "2.0", "id": request_id, "result": result}
+        if "id" not in message:
+            return None
+        return self._error(request_id, error)
+
+    @staticmethod
+    def _error(request_id, error: RPCError):
+        return {"jsonrpc": "2.0", "id": request_id, "error": {"code": error.code, "message": error.message}}
+
+    @contextmanager
+    def _request(self, params):
+        """``(project, settings, files, cache)`` for a request, held until the request ends."""
+        project, settings = self.project(params)
+        try:
+            cache = self.content_cache(settings)
+            files = project.selection()
+            if not files:
+                raise RPCError(SERVER_ERROR, "no files selected")
+            try:
+                yield project, settings, files, cache
+            finally:
+                project.flush()
+        finally:
+            self.release(project)
+
+    def _generate(self, project, settings, files, cache, dest, split: bool, report: dict):
+        needs_counter = settings["max_tokens"] or (split and settings["split_max_tokens"])
+        return generate_output(
+            str(project.folder),
+            str(dest),
+            files,
+            settings["as_markdown"],
+            settings["include_heading"],
+            settings["use_code_block"],
+            cache=cache,
+            workers=settings["read_workers"],
+            max_tokens=settings["max_tokens"],
+            priorities=settings["budget_priorities"],
+            token_counter=project.counter(self.tokenizer(settings)) if needs_counter else None,
+            dedupe=settings["dedupe"],
+            split_tokens=settings["split_max_tokens"] if split else 0,
+            split_bytes=settings["split_max_bytes"] if split else 0,
+            report=report,
+        )
+
+    @staticmethod
+    def _report(project, report):
+        def rel(path):
+            return path.relative_to(project.folder).as_posix()
+
+        return {
+            "skipped": [{"path": rel(path), "reason": reason} for path, reason in report.get("skipped", [])],
+            "dropped": [{"path": rel(path), "reason": reason} for path, reason in report.get("dropped", [])],
+            "duplicates": [{"path": rel(path), "same_as": rel(first)} for path, first in report.get("duplicates", [])],
+        }
+
+    def rpc_pack(self, params):
+        dest = params.get("output") if isinstance(params, dict) else None
+        if not isinstance(dest, str) or not Path(dest).is_dir():
+            raise RPCError(INVALID_PARAMS, f"destination folder not found: {dest}")
+        report = {}
+        with self._request(params) as (project, settings, files, cache):
+            output_path = self._generate(project, settings, files, cache, dest, True, report)
+        result = {"output": str(output_path), "selected": len(files), **self._report(project, report)}
+        if "parts" in report:
+            result["parts"] = [str(part) for part in report["parts"]]
+        return result
+
+    def rpc_preview(self, params):
+        report = {}
+        with self._request(params) as (project, settings, files, cache):
+            with tempfile.TemporaryDirectory(prefix="promptpack-preview-") as tmp:
+                output_path = self._generate(project, settings, files, cache, tmp, False, report)
+                text = Path(output_path).read_text(encoding="utf-8")
+        return {"text": text, "selected": len(files), **self._report(project, report)}
+
+    def rpc_count_tokens(self, params):
+        with self._request(params) as (project, settings, files, cache):
+            return self._count_tokens(project, settings, files, cache)
+
+    def _count_tokens(self, project, settings, files, cache):
+        counter = project.counter(self.tokenizer(settings))
+        start_folder = project.folder
+        args = (settings["as_markdown"], settings["include_heading"], settings["use_code_block"])
+        variant = output_variant(start_folder, *args)
+        duplicates = find_duplicates(files, cache) if settings["dedupe"] else {}
+        counts = {}
+        skipped = []
+        total = counter.count(output_header(start_folder))
+        for path in files:
+            rel = path.relative_to(start_folder).as_posix()
+            first = duplicates.get(path)
+            if first is not None:
+                tokens = counter.count(duplicate_block(start_folder, path, first, settings["include_heading"]))
+            else:
+                def block(path=path):
+                    prefix, suffix = file_block_parts(start_folder, path, *args)
+                    return prefix + cache.read_text(path) + suffix
+
+                try:
+                    tokens = counter.count_file(path, block, variant, cache)
+                except (SkippedFile, OSError) as e:
+                    skipped.append({"path": rel, "reason": getattr(e, "reason", None) or str(e)})
+                    continue
+            counts[rel] = tokens
+            total += tokens
+        return {"tokenizer": counter.tokenizer.label, "total": total, "files": counts, "skipped": skipped}
+
+    def rpc_status(self, params):
+        with self.lock:
+            projects = list(self.projects.values())
+            caches = list(self.content_caches.values())
+        totals = {}
+        for cache in caches:
+            for name, value in cache.stats().items():
+                totals[name] = totals.get(name, 0) + value
+        return {
+            "requests": self.requests,
+            "content_cache": dict(totals, caches=len(caches)),
+            "projects": [
+                {
+                    "src": str(project.folder),
+                    "files": len(project.files or ()),
+                    "scans": project.scans,
+                    "stale": project.stale,
+                    "token_caches": [counter.stats() for counter in project.token_counters.values()],
+                }
+                for project in projects
+            ],
+        }
+
+    def rpc_shutdown(self, params):
+        self.stopped.set()
+        return None
+
+
+def serve_stdio(server: Server, stdin=None, stdout=None):
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    for line in stdin:
+        if not line.strip():
+            continue
+        response = server.handle(line)
+        if response is not None:
+            stdout.write(response + "\n")
+            stdout.flush()
+        if server.stopped.is_set():
+            break
+
+
+def _remove_stale_socket(path):
+    """Remove a socket left behind by a server that did not exit cleanly, and nothing else."""
+    import socket
+
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise SystemExit(f"promptpack: {path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(os.fspath(path))
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+        except OSError as e:
+            raise SystemExit(f"promptpack: cannot check socket {path}: {e}")
+    raise SystemExit(f"promptpack: a server is already listening on {path}")
+
+
+def serve_socket(server: Server, path):
+    if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+        raise SystemExit("promptpack: --socket needs Unix domain sockets, use stdin/stdout instead")
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                response = server.handle(line.decode("utf-8"))
+                if response is not None:
+                    self.wfile.write(response.encode("utf-8") + b"\n")
+                    self.wfile.flush()
+                if server.stopped.is_set():
+                    break
+
+    _remove_stale_socket(path)
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as listener:
+        listener.daemon_threads = True
+
+        def stop_on_shutdown():
+            server.stopped.wait()
+            listener.shutdown()
+
+        threading.Thread(target=stop_on_shutdown, daemon=True).start()
+        try:
+            listener.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+def call(path, method: str, params=None, request_id: int = 1):
+    """Send one request to a server listening on the Unix socket ``path`` and return its result."""
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(os.fspath(path))
+        request = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or {}}
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            response = json.loads(f.readline())
+    if "error" in response:
+        raise RPCError(response["error"]["code"], response["error"]["message"])
+    return response["result"]
+
+
+def run_serve(args):
+    server = Server(args.settings, args.poll)
+    threading.Thread(target=server.poll_forever, daemon=True).start()
+    try:
+        if args.socket:
+            serve_socket(server, args.socket)
+        else:
+            serve_stdio(server)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
@@ -8,17 +8,32 @@ DEFAULT_SETTINGS = {
     "allowed_exts": [".php", ".js", ".ts", ".html", ".css", ".py"],
     "excluded_dirs": ["vendor", ".git", "node_modules"],
     "excluded_files": [".env", "README.md"],
+    "use_gitignore": True,
     "as_markdown": True,
     "include_heading": True,
     "use_code_block": True,
+    "dedupe": False,
     "theme": "dark",
+    "cache_max_bytes": 256 * 1024 * 1024,
+    "read_workers": 1,
+    "max_file_bytes": 1024 * 1024,
+    "max_line_length": 5000,
+    "oversize_action": "truncate",
+    "use_index": True,
+    "use_git_index": False,
+    "tokenizer_vocab": "",
+    "max_tokens": 0,
+    "budget_priorities": ["smaller"],
+    "split_max_tokens": 0,
+    "split_max_bytes": 0,
+    "trace": False,
 }
 
 
-def load_settings():
-    if Path(SETTINGS_FILE).exists():
+def load_settings(path=SETTINGS_FILE):
+    if Path(path).exists():
         try:
-            with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            with open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 return {**DEFAULT_SETTINGS, **data}
         except Exception:
@@ -0,0 +1,187 @@
+"""Pluggable token counting.
+
+``EstimateTokenizer`` keeps the historical ``len(text) / 4`` heuristic.
+``BPETokenizer`` implements byte-level BPE offline from a local rank file in
+the ``tiktoken`` format (one ``<base64 token> <rank>`` pair per line), such as
+``cl100k_base.tiktoken``. ``TokenCounter`` caches per-file counts keyed on
+path, ``st_mtime_ns`` and ``st_size``, like the content cache.
+"""
+import base64
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from .trace import tracer
+from .utils import content_cache, estimate_token_count
+
+# cl100k-style pre-tokenizer; \p{L} and \p{N} are approximated with the
+# classes the standard ``re`` module supports.
+DEFAULT_PATTERN = (
+    r"(?i:'s|'t|'re|'ve|'m|'ll|'d)"
+    r"|(?:[^\r\n\w]|_)?[^\W\d_]+"
+    r"|\d{1,3}"
+    r"| ?(?:[^\s\w]|_)+[\r\n]*"
+    r"|\s*[\r\n]+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+
+class Tokenizer:
+    """Interface for token counters."""
+
+    name = "tokenizer"
+    label = "Tokens"
+
+    def count(self, text: str) -> int:
+        raise NotImplementedError
+
+
+class EstimateTokenizer(Tokenizer):
+    name = "estimate"
+    label = "Token estimate"
+
+    def count(self, text: str) -> int:
+        return estimate_token_count(text)
+
+
+class BPETokenizer(Tokenizer):
+    name = "bpe"
+
+    def __init__(self, ranks: dict, pattern: str = DEFAULT_PATTERN, piece_cache_size: int = 200_000):
+        self.ranks = ranks
+        self._pattern = re.compile(pattern)
+        self._piece_cache = {}
+        self._piece_cache_size = piece_cache_size
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        ranks = {}
+        with open(path, "rb") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    token, rank = line.split()
+                    ranks[base64.b64decode(token)] = int(rank)
+                except ValueError:
+                    raise ValueError(f"{path}:{line_no}: expected '<base64 token> <rank>'") from None
+        if not ranks:
+            raise ValueError(f"{path}: vocabulary is empty")
+        tokenizer = cls(ranks, **kwargs)
+        tokenizer.name = f"bpe:{os.path.basename(path)}"
+        return tokenizer
+
+    def encode(self, text: str):
+        tokens = []
+        for piece in self._pattern.findall(text):
+            tokens.extend(self._encode_piece(piece.encode("utf-8")))
+        return tokens
+
+    def count(self, text: str) -> int:
+        total = 0
+        cache = self._piece_cache
+        for piece in self._pattern.findall(text):
+            n = cache.get(piece)
+            if n is None:
+                n = len(self._encode_piece(piece.encode("utf-8")))
+                if len(cache) >= self._piece_cache_size:
+                    cache.clear()
+                cache[piece] = n
+            total += n
+        return total
+
+    def _encode_piece(self, data: bytes):
+        ranks = self.ranks
+        rank = ranks.get(data)
+        if rank is not None:
+            return [rank]
+        # Merge the adjacent pair with the lowest rank until none is left.
+        # Bytes missing from the vocabulary count as one token each.
+        parts = [data[i:i + 1] for i in range(len(data))]
+        while len(parts) > 1:
+            best = None
+            best_rank = None
+            for i in range(len(parts) - 1):
+                r = ranks.get(parts[i] + parts[i + 1])
+                if r is not None and (best_rank is None or r < best_rank):
+                    best, best_rank = i, r
+            if best is None:
+                break
+            parts[best:best + 2] = [parts[best] + parts[best + 1]]
+        return [ranks.get(p, -1) for p in parts]
+
+
+def load_tokenizer(settings) -> Tokenizer:
+    """Tokenizer configured by ``settings["tokenizer_vocab"]``; the estimate when unset."""
+    vocab = settings.get("tokenizer_vocab")
+    if vocab:
+        return BPETokenizer.from_file(vocab)
+    return EstimateTokenizer()
+
+
+class TokenCounter:
+    """Per-file token counts cached on (path, st_mtime_ns, st_size).
+
+    ``variant`` distinguishes different renderings of the same file, e.g. with
+    and without a heading, so each is counted once. ``store`` is an optional
+    persistent backend such as :class:`promptpack.index.ProjectIndex`
+    consulted on in-memory misses.
+    """
+
+    def __init__(self, tokenizer: Tokenizer = None, max_entries: int = 100_000, store=None):
+        self.tokenizer = tokenizer or EstimateTokenizer()
+        self.store = store
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        return self.tokenizer.count(text)
+
+    def count_file(self, path, text=None, variant=None, cache=None) -> int:
+        """Token count for ``path``.
+
+        ``text`` is what gets tokenized on a miss: a string, a callable
+        returning one, or None to use the file's contents from ``cache``
+        (the shared content cache by default).
+        """
+        cache = cache or content_cache
+        st = os.stat(path)
+        # The sniffing limits decide how much of the file is read.
+        key = (os.fspath(path), variant, cache.limits)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        store = self.store
+        count = None
+        if store is not None:
+            store_key = repr(key)
+            count = store.get_tokens(store_key, self.tokenizer.name, st.st_size, st.st_mtime_ns)
+        if count is None:
+            if text is None:
+                text = cache.read_text(path)
+            elif callable(text):
+                text = text()
+            with tracer.span("tokenize", files=1, bytes=len(text)):
+                count = self.tokenizer.count(text)
+            if store is not None:
+                store.put_tokens(store_key, self.tokenizer.name, st.st_size, st.st_mtime_ns, count)
+        with self._lock:
+            self._entries[key] = (st.st_mtime_ns, st.st_size, count)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return count
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
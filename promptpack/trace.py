@@ -0,0 +1,160 @@
+"""Phase timing for scans, previews and packs.
+
+Code paths wrap their phases (scan, read, format, tokenize, render, write)
+in ``tracer.span(name)``. While the tracer is disabled, which is the default,
+``span`` returns a shared no-op object, so the hooks cost one method call.
+Enabled, each span records its duration and optional ``files``/``bytes``
+counts. Totals per phase are kept alongside the raw events, and both can be
+exported as JSON or as a Chrome trace (``chrome://tracing``, Perfetto).
+
+Phases running on several reader threads are summed across threads, so their
+totals can exceed the wall time of the operation.
+"""
+import json
+import os
+import threading
+import time
+
+MAX_EVENTS = 200_000
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counts):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.args[key] = self.args.get(key, 0) + value
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._caches = {}
+        self.reset()
+
+    def reset(self):
+        """Forget recorded spans and start counting cache hits from now."""
+        with self._lock:
+            self.origin = time.perf_counter()
+            self.events = []
+            self.dropped_events = 0
+            self.phases = {}
+            self._cache_base = {name: self._cache_counts(cache) for name, cache in self._caches.items()}
+
+    def span(self, name: str, **counts):
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, counts)
+
+    def register_cache(self, name: str, cache):
+        """Report the hit rate of ``cache`` (anything with ``hits`` and ``misses``) in summaries."""
+        with self._lock:
+            self._caches[name] = cache
+            self._cache_base[name] = self._cache_counts(cache)
+
+    @staticmethod
+    def _cache_counts(cache):
+        return cache.hits, cache.misses
+
+    def _record(self, name, start, end, args):
+        with self._lock:
+            if len(self.events) < MAX_EVENTS:
+                self.events.append((name, start, end, threading.get_ident(), args))
+            else:
+                self.dropped_events += 1
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = {"count": 0, "seconds": 0.0, "files": 0, "bytes": 0}
+            phase["count"] += 1
+            phase["seconds"] += end - start
+            phase["files"] += args.get("files", 0)
+            phase["bytes"] += args.get("bytes", 0)
+
+    def summary(self) -> dict:
+        with self._lock:
+            caches = {}
+            for name, cache in self._caches.items():
+                hits, misses = self._cache_counts(cache)
+                base_hits, base_misses = self._cache_base.get(name, (0, 0))
+                hits -= base_hits
+                misses -= base_misses
+                total = hits + misses
+                caches[name] = {"hits": hits, "misses": misses, "hit_rate": hits / total if total else None}
+            return {
+                "phases": {name: dict(phase) for name, phase in self.phases.items()},
+                "caches": caches,
+                "events": len(self.events),
+                "dropped_events": self.dropped_events,
+            }
+
+    def status_line(self, phases=("scan", "read", "format", "tokenize", "render", "write")) -> str:
+        """One-line digest of the summary for a status bar."""
+        summary = self.summary()
+        parts = []
+        for name in phases:
+            phase = summary["phases"].get(name)
+            if phase is None:
+                continue
+            detail = f"{name} {phase['seconds'] * 1000:.0f} ms"
+            if phase["files"]:
+                detail += f" ({phase['files']} files)"
+            parts.append(detail)
+        for name, cache in summary["caches"].items():
+            if cache["hit_rate"] is not None:
+                parts.append(f"{name} {cache['hit_rate']:.0%} hits")
+        return " · ".join(parts)
+
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def export_chrome(self, path):
+        """Write the recorded spans in the Chrome trace event format."""
+        pid = os.getpid()
+        with self._lock:
+            events = [
+                {
+                    "name": name,
+                    "cat": "promptpack",
+                    "ph": "X",
+                    "ts": (start - self.origin) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+                for name, start, end, tid, args in self.events
+            ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+tracer = Tracer()
@@ -1,9 +1,18 @@
+import codecs
+import hashlib
+import io
+import json
+import mmap
 import os
+import tempfile
+import threading
+from collections import OrderedDict, deque, namedtuple
+from contextlib import closing
 from pathlib import Path
 from datetime import datetime
-from tempfile import NamedTemporaryFile
-import webbrowser
-import markdown
+
+from .rules import IGNORE_FILE, SelectionRules
+from .trace import tracer
 
 LANG_MAP = {
     ".py": "python",
@@ -24,31 +33,868 @@ def apply_icon(window):
         print(f"Icon not loaded: {e}")
 
 
+def scan_dir(path):
+    """List one directory level with ``os.scandir``, sorted by name.
+
+    Returns ``(dirs, files)`` as lists of ``os.DirEntry``. Symlinks to
+    directories are not followed and entries that cannot be inspected are
+    skipped.
+    """
+    dirs, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry)
+                    elif entry.is_file():
+                        files.append(entry)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    dirs.sort(key=lambda e: e.name)
+    files.sort(key=lambda e: e.name)
+    return dirs, files
+
+
+class Cancelled(Exception):
+    """Raised inside a long-running operation when its cancel event is set."""
+
+
+def check_cancel(cancel):
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+
+
+def _walk_dirs(root, rules: SelectionRules, start: str = "", cancel=None):
+    # Yields ``(rel, scope, files)`` per folder below ``start``, pruning
+    # subfolders by the rules; ``files`` are the folder's file entries.
+    root = os.fspath(root)
+    stack = [start]
+    while stack:
+        check_cancel(cancel)
+        rel = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel) if rel else root)
+        except OSError:
+            continue
+        dirs, files = [], []
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry)
+                except OSError:
+                    continue
+        # The folder's own .gitignore applies to its entries, so it is found first.
+        scope = rules.scope(rel, any(entry.name == IGNORE_FILE for entry in files))
+        for name in dirs:
+            if not rules.prunes(scope, rel, name):
+                stack.append(f"{rel}/{name}" if rel else name)
+        yield rel, scope, files
+
+
+def walk_selected(root, rules: SelectionRules, cancel=None, progress=None):
+    """Yield the relative POSIX path of every file below ``root`` that ``rules`` select.
+
+    Folders are pruned before descending and files filtered by the compiled
+    rules, including any ``.gitignore`` files on the way. The type
+    information cached on each ``DirEntry`` is reused instead of issuing
+    extra ``stat`` calls, and the order of the paths is unspecified.
+    ``cancel`` is an optional ``threading.Event`` checked once per directory.
+    """
+    seen = 0
+    for rel, scope, files in _walk_dirs(root, rules, cancel=cancel):
+        prefix = f"{rel}/" if rel else ""
+        for entry in files:
+            if rules.selects(scope, rel, entry.name):
+                yield prefix + entry.name
+        seen += len(files)
+        if progress is not None:
+            progress(seen, 0)
+
+
+def walk_folder(root, rules: SelectionRules, folder: str):
+    """Yield the relative POSIX path of every file in ``folder``, selected or not.
+
+    ``folder`` is relative to ``root`` and always listed; the folders below
+    it are pruned by ``rules`` as in :func:`walk_selected`.
+    """
+    for rel, _, files in _walk_dirs(root, rules, folder):
+        prefix = f"{rel}/" if rel else ""
+        for entry in files:
+            yield prefix + entry.name
+
+
+def default_selected_names(folder, settings, cancel=None, progress=None):
+    """Relative POSIX paths of the files under ``folder`` included by default under ``settings``.
+
+    ``progress`` is called as ``progress(files_seen, 0)`` while walking.
+    """
+    with tracer.span("scan") as span:
+        names = list(walk_selected(folder, SelectionRules(settings, folder), cancel, progress))
+        span.add(files=len(names))
+    return names
+
+
+def default_selected_files(folder, settings, cancel=None, progress=None):
+    """Like :func:`default_selected_names`, as a set of ``Path`` objects built on ``folder``."""
+    folder = Path(folder)
+    return {folder / name for name in default_selected_names(folder, settings, cancel, progress)}
+
+
+SNIFF_BYTES = 8192
+MMAP_THRESHOLD = 1024 * 1024
+
+# ``max_bytes`` and ``max_line_length`` of 0 disable that check; ``oversize``
+# is "truncate" or "skip" and applies to files above ``max_bytes``.
+FileLimits = namedtuple("FileLimits", ["max_bytes", "max_line_length", "oversize"])
+
+# How a file should be read: ``skip`` is the reason to leave it out, or None;
+# ``truncate_at`` is the byte offset to stop reading at, or None.
+Sniff = namedtuple("Sniff", ["skip", "encoding", "truncate_at"])
+
+PLAIN_SNIFF = Sniff(None, "utf-8", None)
+
+
+class SkippedFile(Exception):
+    """Raised when sniffing leaves a file out of the output."""
+
+    def __init__(self, path, reason: str):
+        super().__init__(f"{path}: {reason}")
+        self.path = path
+        self.reason = reason
+
+
+def file_limits(settings) -> FileLimits:
+    return FileLimits(settings["max_file_bytes"], settings["max_line_length"], settings["oversize_action"])
+
+
+def detect_encoding(prefix: bytes):
+    """Guess the encoding of a file from its first bytes; None means binary."""
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if prefix.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if b"\0" in prefix:
+        return None
+    try:
+        prefix.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A character cut off by the end of the prefix is not an error; a
+        # few stray bytes are tolerated as before, anything more is most
+        # likely a legacy single-byte encoding.
+        if e.start < len(prefix) - 3:
+            invalid = prefix.decode("utf-8", errors="replace").count("\ufffd")
+            if invalid * 100 > len(prefix):
+                return "cp1252"
+    return "utf-8"
+
+
+def sniff_file(path, limits: FileLimits, size: int = None) -> Sniff:
+    """Decide from a small prefix whether and how ``path`` should be read.
+
+    Files with NUL bytes (and no UTF-16 BOM) are skipped as binary, files
+    whose prefix has a line over ``limits.max_line_length`` characters are
+    skipped as minified or generated, and files over ``limits.max_bytes``
+    are skipped or cut at the last line break before the limit. Files of
+    ``MMAP_THRESHOLD`` bytes or more are mapped rather than read, so only
+    the pages that are looked at are loaded.
+    """
+    if size is None:
+        size = os.stat(path).st_size
+    if size == 0:
+        return PLAIN_SNIFF
+    oversized = bool(limits.max_bytes) and size > limits.max_bytes
+    if oversized and limits.oversize == "skip":
+        return Sniff(f"larger than {format_size(limits.max_bytes)} ({format_size(size)})", None, None)
+
+    prefix_len = max(SNIFF_BYTES, limits.max_line_length + 1)
+    with open(path, "rb") as f:
+        if size >= MMAP_THRESHOLD:
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            view = f.read(size if oversized else prefix_len)
+        try:
+            prefix = view[:prefix_len]
+            encoding = detect_encoding(prefix)
+            if encoding is None:
+                return Sniff("binary (contains NUL bytes)", None, None)
+            if limits.max_line_length:
+                longest = max(len(line) for line in prefix.decode(encoding, errors="ignore").split("\n"))
+                if longest > limits.max_line_length:
+                    return Sniff(f"line longer than {limits.max_line_length} characters", None, None)
+            truncate_at = None
+            if oversized:
+                cut = view.rfind(b"\n", 0, limits.max_bytes)
+                truncate_at = cut + 1 if cut >= 0 else limits.max_bytes
+            return Sniff(None, encoding, truncate_at)
+        finally:
+            if isinstance(view, mmap.mmap):
+                view.close()
+
+
+def iter_file_chunks(path, encoding: str = "utf-8", limit: int = None, chunk_size: int = None):
+    """Yield the decoded text of ``path`` in chunks, stopping after ``limit`` bytes.
+
+    Decoding ignores invalid bytes and translates line endings like a file
+    opened in text mode.
+    """
+    chunk_size = chunk_size or COPY_CHUNK_SIZE
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(errors="ignore"), translate=True)
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            data = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not data:
+                break
+            if remaining is not None:
+                remaining -= len(data)
+            text = decoder.decode(data)
+            if text:
+                yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def truncation_note(shown: int, size: int) -> str:
+    return f"\n[... truncated: first {format_size(shown)} of {format_size(size)} shown]"
+
+
+class ContentCache:
+    """LRU cache of decoded file contents bounded by a byte budget.
+
+    Entries are keyed on the path and validated against ``st_mtime_ns`` and
+    ``st_size``, so a changed file is read again on its next lookup while an
+    unchanged one only costs a ``stat`` call. The budget is measured in
+    on-disk bytes; files larger than the whole budget are never cached.
+    The cache is safe to share between reader threads.
+
+    With ``limits`` set, each file is sniffed before it is read (see
+    :func:`sniff_file`): skipped files raise :class:`SkippedFile` and
+    oversized ones are truncated. The outcome is cached like the contents.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, limits: FileLimits = None):
+        self.max_bytes = max_bytes
+        self.limits = limits
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def sniff(self, path, size: int = None) -> Sniff:
+        if self.limits is None:
+            return PLAIN_SNIFF
+        return sniff_file(path, self.limits, size)
+
+    def read_text(self, path) -> str:
+        key = os.fspath(path)
+        st = os.stat(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if entry[4] is not None:
+                    raise SkippedFile(path, entry[4])
+                return entry[2]
+            self.misses += 1
+
+        with tracer.span("read", files=1) as span:
+            sniff = self.sniff(key, st.st_size)
+            if sniff.skip is not None:
+                with self._lock:
+                    self._store(key, st.st_mtime_ns, st.st_size, None, 0, sniff.skip)
+                raise SkippedFile(path, sniff.skip)
+            if sniff.truncate_at is not None:
+                content = "".join(iter_file_chunks(key, sniff.encoding, sniff.truncate_at))
+                content += truncation_note(sniff.truncate_at, st.st_size)
+                cost = sniff.truncate_at
+            else:
+                with open(key, encoding=sniff.encoding, errors='ignore') as f:
+                    content = f.read()
+                cost = st.st_size
+            span.add(bytes=cost)
+        with self._lock:
+            self._store(key, st.st_mtime_ns, st.st_size, content, cost)
+        return content
+
+    def _store(self, key, mtime_ns, size, content, cost, skip=None):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[3]
+        if cost > self.max_bytes:
+            return
+        self._entries[key] = (mtime_ns, size, content, cost, skip)
+        self._bytes += cost
+        self._trim()
+
+    def digest(self, path) -> str:
+        """SHA-1 of the text ``read_text`` returns for ``path``.
+
+        Digests are kept per path, validated like the contents, and outlive
+        evicted contents. Files above ``STREAM_THRESHOLD`` are hashed as they
+        are streamed instead of being loaded whole.
+        """
+        key = os.fspath(path)
+        st = os.stat(key)
+        with self._lock:
+            entry = self._digests.get(key)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                return entry[2]
+        h = hashlib.sha1()
+        sniff = self.sniff(key, st.st_size) if st.st_size > STREAM_THRESHOLD else None
+        if sniff is not None and sniff.skip is None and (sniff.truncate_at or st.st_size) > STREAM_THRESHOLD:
+            for chunk in iter_file_chunks(key, sniff.encoding, sniff.truncate_at):
+                h.update(chunk.encode("utf-8", "surrogatepass"))
+        else:
+            h.update(self.read_text(path).encode("utf-8", "surrogatepass"))
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[key] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._trim()
+
+    def set_limits(self, limits: FileLimits):
+        with self._lock:
+            if limits != self.limits:
+                self.limits = limits
+                self._entries.clear()
+                self._digests.clear()
+                self._bytes = 0
+
+    def _trim(self):
+        while self._entries and self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[3]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+content_cache = ContentCache()
+tracer.register_cache("content cache", content_cache)
+
+
+# ``text`` is None when the file is above the stream threshold and should be
+# copied from disk by the caller instead.
+FileText = namedtuple("FileText", ["path", "text"])
+
+
+def iter_file_texts(paths, workers: int = 1, cache: ContentCache = None, stream_threshold: int = None, skipped: list = None):
+    """Read and decode ``paths`` on up to ``workers`` threads.
+
+    Results are yielded in the order of ``paths`` regardless of which read
+    finishes first. Files that cannot be read are skipped; files left out by
+    the cache's sniffing limits are appended to ``skipped`` as
+    ``(path, reason)``. Only a bounded window of reads runs ahead of the
+    consumer, so a slow writer does not cause the whole selection to pile up
+    in memory.
+    """
+    cache = cache or content_cache
+
+    def load(path):
+        try:
+            if stream_threshold is not None:
+                size = os.stat(path).st_size
+                if size > stream_threshold:
+                    sniff = cache.sniff(path, size)
+                    if sniff.skip is not None:
+                        raise SkippedFile(path, sniff.skip)
+                    if sniff.truncate_at is None or sniff.truncate_at > stream_threshold:
+                        return FileText(path, None)
+            return FileText(path, cache.read_text(path))
+        except SkippedFile as e:
+            return e
+        except Exception:
+            return None
+
+    def results():
+        if workers <= 1:
+            for path in paths:
+                yield load(path)
+            return
+
+        # Imported here: concurrent.futures pulls in logging, which noticeably
+        # slows down CLI start-up when only one reader is used.
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for path in paths:
+                pending.append(pool.submit(load, path))
+                if len(pending) >= workers * 4:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    for item in results():
+        if isinstance(item, SkippedFile):
+            if skipped is not None:
+                skipped.append((item.path, item.reason))
+        elif item is not None:
+            yield item
+
+
+def format_size(num_bytes: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+
 def estimate_token_count(text: str) -> int:
     return int(len(text) / 4)
 
 
-def generate_output(start_folder: str, dest_folder: str, included_files, as_markdown: bool, include_heading: bool, use_code_block: bool):
-    lines = []
+STREAM_THRESHOLD = 4 * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_umask = None
+_umask_lock = threading.Lock()
+
+
+def _new_file_mode() -> int:
+    """Permissions a file created now would get, read without changing the umask where possible."""
+    global _umask
+    with _umask_lock:
+        if _umask is None:
+            try:
+                with open("/proc/self/status", encoding="ascii") as f:
+                    _umask = next(int(line.split()[1], 8) for line in f if line.startswith("Umask:"))
+            except (OSError, StopIteration, ValueError, IndexError):
+                # os.umask can only be read by setting it; 022 keeps files
+                # another thread creates meanwhile from being world-writable.
+                _umask = os.umask(0o022)
+                os.umask(_umask)
+        return 0o666 & ~_umask
+
+
+class AtomicWriter:
+    """Text file writer that only replaces ``path`` once it is complete.
+
+    Output goes to a temporary file in the destination folder, which is
+    renamed into place on success and removed on error, so a crash never
+    leaves a half-written file behind.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = None
+        self._tmp_name = None
+
+    def __enter__(self):
+        fd, self._tmp_name = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp"
+        )
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+        return self._file
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._file.close()
+            if exc_type is None:
+                # mkstemp creates the file as 0600; keep the permissions of
+                # the file being replaced, or give a new one the usual ones.
+                try:
+                    mode = os.stat(self.path).st_mode & 0o7777
+                except OSError:
+                    mode = _new_file_mode()
+                os.chmod(self._tmp_name, mode)
+                os.replace(self._tmp_name, self.path)
+        finally:
+            if os.path.exists(self._tmp_name):
+                os.unlink(self._tmp_name)
+        return False
+
+
+def output_header(start_folder, part: int = None) -> str:
     project_name = Path(start_folder).name
     date_str = datetime.now().strftime('%Y%m%d')
-    lines.append(f"Project: {project_name} - {date_str}\n\n")
+    if part is not None:
+        return f"Project: {project_name} - {date_str} - part {part}\n\n"
+    return f"Project: {project_name} - {date_str}\n\n"
+
+
+def find_duplicates(paths, cache: ContentCache = None, cancel=None):
+    """Map each file of ``paths`` whose contents repeat an earlier one to that first path.
 
-    for path in included_files:
+    Only files sharing their size with another file are hashed, and hashing
+    goes through the content cache, so files already read cost nothing extra.
+    Files that cannot be read or are skipped by sniffing are never matched.
+    """
+    cache = cache or content_cache
+    by_size = {}
+    for path in paths:
         try:
-            content = path.read_text(encoding='utf-8', errors='ignore')
-        except Exception:
+            by_size.setdefault(os.stat(path).st_size, []).append(path)
+        except OSError:
+            continue
+
+    duplicates = {}
+    for group in by_size.values():
+        if len(group) < 2:
             continue
-        rel_path = path.relative_to(start_folder)
-        if include_heading:
-            lines.append(f"## {rel_path.as_posix()}\n")
-        if as_markdown and use_code_block:
-            lang = LANG_MAP.get(path.suffix, '')
-            lines.append(f"```{lang}\n{content}\n```\n\n")
+        first_by_digest = {}
+        for path in group:
+            check_cancel(cancel)
+            try:
+                digest = cache.digest(path)
+            except Exception:
+                continue
+            first = first_by_digest.setdefault(digest, path)
+            if first != path:
+                duplicates[path] = first
+    return duplicates
+
+
+def duplicate_block(start_folder, path: Path, first: Path, include_heading: bool) -> str:
+    """Short reference written instead of a file whose contents were already written."""
+    first_rel = first.relative_to(start_folder).as_posix()
+    if include_heading:
+        return f"## {path.relative_to(start_folder).as_posix()}\nSame content as {first_rel}.\n\n"
+    return f"{path.relative_to(start_folder).as_posix()}: same content as {first_rel}.\n\n"
+
+
+def file_block_parts(start_folder, path: Path, as_markdown: bool, include_heading: bool, use_code_block: bool, continued: bool = False):
+    """Return the ``(prefix, suffix)`` written around a file's content in the output.
+
+    ``continued`` marks the heading of a file that carries on from the
+    previous part of a split output.
+    """
+    prefix = ""
+    if include_heading:
+        prefix += f"## {path.relative_to(start_folder).as_posix()}{' (continued)' if continued else ''}\n"
+    if as_markdown and use_code_block:
+        prefix += f"```{LANG_MAP.get(path.suffix, '')}\n"
+        return prefix, "\n```\n\n"
+    return prefix, "\n\n"
+
+
+def output_variant(start_folder, as_markdown: bool, include_heading: bool, use_code_block: bool):
+    """Token-cache variant for a file's block as written by ``generate_output``."""
+    return ("output", os.fspath(start_folder), as_markdown, include_heading, use_code_block)
+
+
+def part_path(output_file: Path, number: int) -> Path:
+    return output_file.with_name(f"{output_file.stem}.part{number:03d}{output_file.suffix}")
+
+
+def iter_lines(chunks):
+    """Regroup text chunks into lines, keeping the line endings."""
+    tail = ""
+    for chunk in chunks:
+        lines = (tail + chunk).splitlines(keepends=True)
+        tail = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        yield from lines
+    if tail:
+        yield tail
+
+
+class SplitWriter:
+    """Write the output as numbered part files of at most ``max_tokens`` and ``max_bytes``.
+
+    A file only spans parts when it does not fit in an empty part on its
+    own; it is then cut at line breaks, with its fence closed at the end of
+    the part and reopened under a "(continued)" heading in the next one.
+    Each part is renamed into place as soon as it is full. A manifest next to
+    the parts maps every source path to the part(s) holding it.
+
+    Without either limit a single file is written to ``path``, exactly as
+    before, and no manifest is written.
+    """
+
+    def __init__(self, path, start_folder, max_tokens: int = 0, max_bytes: int = 0, token_counter=None, variant=None, cache=None):
+        self.path = Path(path)
+        self.start_folder = start_folder
+        self.max_tokens = max_tokens or 0
+        self.max_bytes = max_bytes or 0
+        self.split = bool(self.max_tokens or self.max_bytes)
+        if self.max_tokens and token_counter is None:
+            from .tokenizer import TokenCounter
+
+            token_counter = TokenCounter()
+        self.token_counter = token_counter
+        self.variant = variant
+        self.cache = cache
+        self.parts = []
+        self.manifest = {}
+        self.manifest_path = self.path.with_name(f"{self.path.stem}.manifest.json")
+        self._writer = None
+        self._out = None
+        self._tokens = self._bytes = 0
+        self._has_files = False
+
+    def __enter__(self):
+        self._open_part()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._writer.__exit__(exc_type, exc, tb)
+        if exc_type is not None:
+            # Parts that were already complete go too: no partial set is left.
+            for part in self.parts[:-1]:
+                try:
+                    os.unlink(part)
+                except OSError:
+                    pass
+        elif self.split:
+            self._write_manifest()
+        return False
+
+    def _open_part(self):
+        number = len(self.parts) + 1
+        path = part_path(self.path, number) if self.split else self.path
+        self._writer = AtomicWriter(path)
+        self._out = self._writer.__enter__()
+        self.parts.append(path)
+        self._tokens = self._bytes = 0
+        self._has_files = False
+        self._emit(output_header(self.start_folder, number if self.split else None))
+
+    def _next_part(self):
+        self._writer.__exit__(None, None, None)
+        self._open_part()
+
+    def _write_manifest(self):
+        manifest = {
+            "parts": [p.name for p in self.parts],
+            "files": self.manifest,
+        }
+        with AtomicWriter(self.manifest_path) as f:
+            json.dump(manifest, f, indent=2)
+
+    def cost(self, text: str):
+        # Pieces are counted separately, and their counts can add up to one
+        # token per boundary less than the joined text, hence the + 1.
+        return (
+            self.token_counter.count(text) + 1 if self.max_tokens else 0,
+            len(text.encode("utf-8", "surrogatepass")) if self.max_bytes else 0,
+        )
+
+    def fits(self, tokens: int, nbytes: int) -> bool:
+        return (not self.max_tokens or self._tokens + tokens <= self.max_tokens) \
+            and (not self.max_bytes or self._bytes + nbytes <= self.max_bytes)
+
+    def _emit(self, text: str, cost=None):
+        self._out.write(text)
+        if self.split:
+            tokens, nbytes = cost or self.cost(text)
+            self._tokens += tokens
+            self._bytes += nbytes
+
+    def _record(self, path):
+        rel = path.relative_to(self.start_folder).as_posix()
+        name = self.parts[-1].name
+        names = self.manifest.setdefault(rel, [])
+        if name not in names:
+            names.append(name)
+        self._has_files = True
+
+    def write_block(self, path: Path, text: str):
+        """Write a short block, such as a duplicate reference, that is never split."""
+        if self.split:
+            cost = self.cost(text)
+            if self._has_files and not self.fits(*cost):
+                self._next_part()
+            self._emit(text, cost)
+            self._record(path)
+        else:
+            self._out.write(text)
+
+    def write_file(self, path: Path, prefix: str, suffix: str, content: str = None, chunks=None, size: int = 0, continued_prefix: str = None):
+        """Write one file's block from ``content``, or from the text ``chunks`` of a streamed file."""
+        if not self.split:
+            self._out.write(prefix)
+            if content is not None:
+                self._out.write(content)
+            else:
+                for chunk in chunks:
+                    self._out.write(chunk)
+            self._out.write(suffix)
+            return
+
+        if content is not None:
+            # The whole block is counted through the token counter's cache,
+            # with the same key the budget packer uses.
+            tokens = nbytes = 0
+            if self.max_tokens:
+                tokens = self.token_counter.count_file(path, lambda: prefix + content + suffix, self.variant, self.cache) + 1
+            if self.max_bytes:
+                nbytes = len(prefix.encode("utf-8")) + len(content.encode("utf-8", "surrogatepass")) + len(suffix.encode("utf-8"))
+            cost = (tokens, nbytes)
+            if self._has_files and not self.fits(*cost):
+                self._next_part()
+            if self.fits(*cost):
+                self._out.write(prefix)
+                self._out.write(content)
+                self._out.write(suffix)
+                self._tokens += cost[0]
+                self._bytes += cost[1]
+                self._record(path)
+                return
+            lines = iter(content.splitlines(keepends=True))
         else:
-            lines.append(f"{content}\n\n")
+            # Streamed files are only measured as they are copied; the size
+            # on disk stands in for both limits when choosing where to start.
+            if self._has_files and not self.fits(size // 4, size):
+                self._next_part()
+            lines = iter_lines(chunks)
+        self._write_split(path, prefix, suffix, lines, continued_prefix or prefix)
+
+    def _write_split(self, path, prefix, suffix, lines, continued_prefix):
+        suffix_cost = self.cost(suffix)
+        self._emit(prefix)
+        self._record(path)
+        started = False
+        for line in lines:
+            cost = self.cost(line)
+            if started and not self.fits(cost[0] + suffix_cost[0], cost[1] + suffix_cost[1]):
+                self._emit(suffix, suffix_cost)
+                self._next_part()
+                self._emit(continued_prefix)
+                self._record(path)
+            self._emit(line, cost)
+            started = True
+        self._emit(suffix, suffix_cost)
+
+
+def generate_output(start_folder: str, dest_folder: str, included_files, as_markdown: bool, include_heading: bool, use_code_block: bool, cache: ContentCache = None, workers: int = 1, max_tokens: int = None, priorities=(), token_counter=None, dedupe: bool = False, split_tokens: int = 0, split_bytes: int = 0, report: dict = None, cancel=None, progress=None):
+    """Stream the selected files into ``{project}-{date}.md|txt`` in ``dest_folder``.
+
+    Files up to ``STREAM_THRESHOLD`` bytes are read through the content cache
+    on ``workers`` threads, larger ones are copied in chunks, so memory use
+    does not grow with the size of the output.
+
+    With ``max_tokens`` the selection is first narrowed by
+    :func:`promptpack.budget.fit_to_budget` using ``priorities``. When a
+    ``report`` dict is given it is filled with details about the run, such as
+    the token total, the files that were dropped and the files that were
+    skipped by the cache's sniffing limits (see :func:`sniff_file`).
+
+    With ``dedupe`` a file whose contents were already written is replaced
+    by a short reference to the first path with the same contents.
+
+    With ``split_tokens`` or ``split_bytes`` the output is written as
+    numbered part files of at most that size, plus a manifest mapping each
+    source path to its part (see :class:`SplitWriter`); the manifest's path
+    is returned instead of the output file's, and ``report["parts"]`` lists
+    the parts.
 
+    ``cancel`` is an optional ``threading.Event``; once set, generation stops
+    with :class:`Cancelled` and no output file is left behind. ``progress``
+    is called as ``progress(files_written, characters_written)``.
+    """
+    cache = cache or content_cache
+    included_files = list(included_files)
+    duplicates = find_duplicates(included_files, cache, cancel) if dedupe else {}
+    if max_tokens:
+        from .budget import fit_to_budget
+
+        result = fit_to_budget(
+            start_folder, included_files, max_tokens, priorities,
+            as_markdown, include_heading, use_code_block, token_counter, cancel, duplicates, cache,
+        )
+        included_files = result.selected
+        if duplicates:
+            duplicates = find_duplicates(included_files, cache, cancel)
+        if report is not None:
+            report["tokens"] = result.tokens
+            report["dropped"] = result.dropped
+
+    project_name = Path(start_folder).name
+    date_str = datetime.now().strftime('%Y%m%d')
     output_file = Path(dest_folder) / f"{project_name}-{date_str}.{ 'md' if as_markdown else 'txt' }"
-    output_file.write_text(''.join(lines), encoding='utf-8')
-    return output_file
 
+    skipped = []
+    position = {path: i for i, path in enumerate(included_files)}
+    pending = deque(path for path in included_files if path in duplicates)
+    if report is not None:
+        report["skipped"] = skipped
+        report["duplicates"] = [(path, duplicates[path]) for path in pending]
+        report["saved_bytes"] = 0
+    files_done = chars_done = 0
+    variant = output_variant(start_folder, as_markdown, include_heading, use_code_block)
+    writer = SplitWriter(output_file, start_folder, split_tokens, split_bytes, token_counter, variant, cache)
+    with writer:
+
+        def write_references(before=None):
+            # References keep their place in the selection order.
+            while pending and (before is None or position[pending[0]] < before):
+                path = pending.popleft()
+                writer.write_block(path, duplicate_block(start_folder, path, duplicates[path], include_heading))
+                if report is not None:
+                    try:
+                        report["saved_bytes"] += os.stat(path).st_size
+                    except OSError:
+                        pass
+
+        def streamed(source, note):
+            nonlocal chars_done
+            with closing(source):
+                for chunk in source:
+                    check_cancel(cancel)
+                    chars_done += len(chunk)
+                    yield chunk
+            if note:
+                yield note
+
+        unique_files = [path for path in included_files if path not in duplicates]
+        for path, content in iter_file_texts(unique_files, workers, cache, STREAM_THRESHOLD, skipped):
+            check_cancel(cancel)
+            write_references(position[path])
+            chunks = None
+            if content is None:
+                try:
+                    size = os.stat(path).st_size
+                    sniff = cache.sniff(path, size)
+                    source = iter_file_chunks(path, sniff.encoding, sniff.truncate_at)
+                except Exception:
+                    continue
+                note = truncation_note(sniff.truncate_at, size) if sniff.truncate_at is not None else ""
+                chunks = streamed(source, note)
+            else:
+                size = 0
+                chars_done += len(content)
+            with tracer.span("format"):
+                prefix, suffix = file_block_parts(start_folder, path, as_markdown, include_heading, use_code_block)
+                continued_prefix = None
+                if writer.split:
+                    continued_prefix = file_block_parts(start_folder, path, as_markdown, include_heading, use_code_block, True)[0]
+            written = chars_done
+            with tracer.span("write", files=1) as span:
+                writer.write_file(path, prefix, suffix, content, chunks, size, continued_prefix)
+                span.add(bytes=chars_done - written if content is None else len(content))
+            files_done += 1
+            if progress is not None:
+                progress(files_done, chars_done)
+        write_references()
+    if writer.split:
+        if report is not None:
+            report["parts"] = writer.parts
+        return writer.manifest_path
+    return output_file
@@ -0,0 +1,214 @@
+"""Windowed viewer for the live preview.
+
+The preview document is never held whole. :class:`PreviewDocument` keeps,
+per file, only the number of lines its segment takes, and the offset of
+each segment is derived from those counts. Lines are produced on demand by
+a loader, which formats the segment again from the content cache, and the
+most recently shown segments are kept in a small LRU.
+
+:class:`VirtualText` shows the document in a ``tk.Text`` that holds only
+the lines around the visible region. Scrolling within that window is left
+to Tk; when the view gets within ``MARGIN_LINES`` of either end the window
+is refilled around it. Its scrollbar covers the whole document, so the
+widget costs the same for ten files as for a hundred thousand.
+"""
+import bisect
+import tkinter as tk
+from collections import OrderedDict
+from itertools import accumulate
+from tkinter import ttk
+
+MARGIN_LINES = 300
+WINDOW_LINES = 1000
+# Budget, in characters, of formatted segments kept for scrolling back.
+SEGMENT_CACHE_CHARS = 8 * 1024 * 1024
+
+
+class PreviewDocument:
+    """Line-addressable preview built from a header and one segment per file.
+
+    ``loader(path)`` returns the text of a file's segment. Each segment's
+    line count is recorded when it is added; if the loader later returns a
+    different number of lines (the file changed or vanished), the lines are
+    padded or cut so the offsets of the other segments stay valid until the
+    next rebuild.
+    """
+
+    def __init__(self, loader, cache_chars: int = SEGMENT_CACHE_CHARS):
+        self.loader = loader
+        self.cache_chars = cache_chars
+        self.header = [""]
+        self.paths = []
+        self.counts = []
+        # offsets[i] is the first line of segment i after the header, and
+        # the extra last entry the number of lines after it. Edits cut the
+        # list at the first moved segment; it is completed when needed.
+        self._offsets = [0]
+        self._cache = OrderedDict()
+        self._cached_chars = 0
+
+    @staticmethod
+    def line_count(text: str) -> int:
+        return text.count("\n") + 1
+
+    def set_header(self, text: str):
+        self.header = text.split("\n")
+
+    def reset(self, paths, counts):
+        self.paths = list(paths)
+        self.counts = list(counts)
+        del self._offsets[1:]
+        self.clear_cache()
+
+    def insert(self, pos: int, path, count: int):
+        self.paths.insert(pos, path)
+        self.counts.insert(pos, count)
+        self._moved(pos)
+
+    def remove(self, pos: int):
+        path = self.paths.pop(pos)
+        del self.counts[pos]
+        self._moved(pos)
+        self._forget(path)
+
+    def _moved(self, pos: int):
+        # Segments after ``pos`` start elsewhere now.
+        del self._offsets[pos + 1:]
+
+    def clear_cache(self):
+        self._cache.clear()
+        self._cached_chars = 0
+
+    def _forget(self, path):
+        lines = self._cache.pop(path, None)
+        if lines is not None:
+            self._cached_chars -= sum(map(len, lines))
+
+    def _current_offsets(self):
+        offsets = self._offsets
+        start = len(offsets) - 1
+        if start < len(self.counts):
+            offsets.extend(accumulate(self.counts[start:], initial=offsets[start]))
+            del offsets[start + 1]
+        return offsets
+
+    @property
+    def total_lines(self) -> int:
+        return len(self.header) + self._current_offsets()[-1]
+
+    def segment_start(self, index: int) -> int:
+        """Document line where segment ``index`` begins."""
+        return len(self.header) + self._current_offsets()[index]
+
+    def segment_at(self, line: int) -> int:
+        """Index of the segment holding document line ``line``, or -1 for the header."""
+        line -= len(self.header)
+        if line < 0 or not self.counts:
+            return -1
+        return min(bisect.bisect_right(self._current_offsets(), line) - 1, len(self.counts) - 1)
+
+    def segment_lines(self, index: int):
+        path = self.paths[index]
+        lines = self._cache.get(path)
+        if lines is not None:
+            self._cache.move_to_end(path)
+            return lines
+        try:
+            lines = self.loader(path).split("\n")
+        except Exception:
+            lines = []
+        count = self.counts[index]
+        if len(lines) != count:
+            lines = (lines + [""] * count)[:count]
+        self._cache[path] = lines
+        self._cached_chars += sum(map(len, lines))
+        while self._cached_chars > self.cache_chars and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_chars -= sum(map(len, evicted))
+        return lines
+
+    def lines(self, start: int, count: int):
+        """Up to ``count`` document lines from line ``start``."""
+        out = []
+        header = len(self.header)
+        if start < header:
+            out.extend(self.header[start:start + count])
+        index = max(self.segment_at(start), 0)
+        while len(out) < count and index < len(self.counts):
+            first = self.segment_start(index)
+            skip = max(start + len(out) - first, 0)
+            out.extend(self.segment_lines(index)[skip:skip + count - len(out)])
+            index += 1
+        return out
+
+
+class VirtualText(ttk.Frame):
+    """Read-only text view over a :class:`PreviewDocument` that loads only what is near the view."""
+
+    def __init__(self, master, document: PreviewDocument, on_section=None, **text_options):
+        super().__init__(master)
+        self.document = document
+        self.on_section = on_section
+        self.text = tk.Text(self, state="disabled", **text_options)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.on_scrollbar)
+        self.text.configure(yscrollcommand=self.on_text_scrolled)
+        self.scrollbar.pack(side="right", fill="y")
+        self.text.pack(side="left", fill="both", expand=True)
+        self.window_start = 0
+        self.window_lines = 0
+        self.section = None
+        self._refill_pending = False
+
+    def _local_line(self, y: int) -> int:
+        return int(self.text.index(f"@0,{y}").split(".")[0]) - 1
+
+    def top_line(self) -> int:
+        return self.window_start + self._local_line(0)
+
+    def fill(self, start: int):
+        self.window_start = start
+        lines = self.document.lines(start, WINDOW_LINES)
+        self.window_lines = len(lines)
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("1.0", "\n".join(lines))
+        self.text.configure(state="disabled")
+
+    def goto(self, line: int):
+        """Scroll so document line ``line`` is at the top."""
+        self._refill_pending = False
+        line = max(0, min(line, self.document.total_lines - 1))
+        self.fill(max(0, line - MARGIN_LINES))
+        self.text.yview(f"{line - self.window_start + 1}.0")
+
+    def refresh(self):
+        """Reload the window, e.g. after the document changed, keeping the top line."""
+        self.goto(self.top_line())
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.goto(int(float(amount) * self.document.total_lines))
+        else:
+            self.text.yview_scroll(int(amount), unit)
+
+    def on_text_scrolled(self, first, last):
+        total = max(self.document.total_lines, 1)
+        top = self.top_line()
+        bottom = self.window_start + self._local_line(self.text.winfo_height()) + 1
+        self.scrollbar.set(top / total, min(bottom / total, 1.0))
+        section = self.document.segment_at(top)
+        if section != self.section:
+            self.section = section
+            if self.on_section is not None:
+                self.on_section(section)
+        near_start = self.window_start > 0 and top - self.window_start < MARGIN_LINES // 2
+        window_end = self.window_start + self.window_lines
+        near_end = window_end < total and window_end - bottom < MARGIN_LINES // 2
+        if (near_start or near_end) and not self._refill_pending:
+            # Refilling from inside Tk's scroll callback would re-enter it.
+            self._refill_pending = True
+            self.after_idle(self._refill)
+
+    def _refill(self):
+        if self._refill_pending:
+            self.refresh()
@@ -0,0 +1,72 @@
+"""Run long operations off the Tk main thread.
+
+A :class:`BackgroundJob` calls ``func(cancel, progress)`` on a worker thread.
+The worker never touches Tk. It hands results to a queue that the main thread
+polls with ``root.after``, so callbacks always run on the Tk thread.
+"""
+import queue
+import threading
+
+from .utils import Cancelled
+
+
+class BackgroundJob:
+    def __init__(self, root, func, on_done, on_error=None, on_progress=None, on_finish=None, poll_ms: int = 50):
+        self.root = root
+        self.func = func
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+        self.poll_ms = poll_ms
+        self.cancel_event = threading.Event()
+        self._queue = queue.Queue()
+        self._progress = None
+        self._progress_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.root.after(self.poll_ms, self._poll)
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _report(self, files: int, nbytes: int):
+        # Only the latest value matters, so progress is not queued.
+        with self._progress_lock:
+            self._progress = (files, nbytes)
+
+    def _run(self):
+        try:
+            result = self.func(self.cancel_event, self._report)
+        except Cancelled:
+            self._queue.put(("cancelled", None))
+        except Exception as e:
+            self._queue.put(("error", e))
+        else:
+            self._queue.put(("done", result))
+
+    def _poll(self):
+        with self._progress_lock:
+            progress, self._progress = self._progress, None
+        if progress is not None and self.on_progress:
+            self.on_progress(*progress)
+        try:
+            kind, value = self._queue.get_nowait()
+        except queue.Empty:
+            self.root.after(self.poll_ms, self._poll)
+            return
+
+        # on_finish runs first so that on_done may start a follow-up job.
+        if self.on_finish:
+            self.on_finish(kind)
+        if kind == "done":
+            self.on_done(value)
+        elif kind == "error" and self.on_error:
+            self.on_error(value)
@@ -0,0 +1,95 @@
+"""Dropping a project while a request is still using it.
+
+    python -m pytest tests
+"""
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from promptpack import server as server_module  # noqa: E402
+from promptpack.server import Server  # noqa: E402
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMPTPACK_CACHE_DIR", str(tmp_path / "cache"))
+    for name in ("one", "two"):
+        folder = tmp_path / name
+        folder.mkdir()
+        for i in range(5):
+            (folder / f"file{i}.py").write_text(f"value = {i}\n", encoding="utf-8")
+    server = Server(tmp_path / "settings.json")
+    yield server
+    server.close()
+
+
+def request(server, method, **params):
+    return json.loads(server.handle(json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params})))
+
+
+def start_blocked_pack(server, monkeypatch, folder, dest):
+    """Start a pack on a thread and return once it is inside ``generate_output``."""
+    entered = threading.Event()
+    resume = threading.Event()
+    generate_output = server_module.generate_output
+
+    def blocking_generate_output(*args, **kwargs):
+        entered.set()
+        assert resume.wait(10)
+        return generate_output(*args, **kwargs)
+
+    monkeypatch.setattr(server_module, "generate_output", blocking_generate_output)
+    responses = []
+    # max_tokens makes the pack count tokens through the project's index.
+    thread = threading.Thread(target=lambda: responses.append(
+        request(server, "pack", src=str(folder), output=str(dest), settings={"max_tokens": 100_000})
+    ))
+    thread.start()
+    assert entered.wait(10)
+    monkeypatch.setattr(server_module, "generate_output", generate_output)
+    return resume, thread, responses
+
+
+def finish(resume, thread, responses):
+    resume.set()
+    thread.join(10)
+    assert "error" not in responses[0], responses[0]
+    assert responses[0]["result"]["selected"] == 5
+
+
+def test_evicted_project_stays_open_until_its_request_ends(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server_module, "MAX_PROJECTS", 1)
+    resume, thread, responses = start_blocked_pack(server, monkeypatch, tmp_path / "one", tmp_path)
+    (project,) = server.projects.values()
+    assert project.index is not None
+
+    # A request on another folder evicts the busy project.
+    assert "result" in request(server, "count_tokens", src=str(tmp_path / "two"))
+    assert project.retired and project.index is not None
+
+    finish(resume, thread, responses)
+    assert project.index is None
+    assert not server.retiring
+
+
+def test_settings_reload_waits_for_running_requests(server, tmp_path, monkeypatch):
+    resume, thread, responses = start_blocked_pack(server, monkeypatch, tmp_path / "one", tmp_path)
+    (project,) = server.projects.values()
+
+    (tmp_path / "settings.json").write_text(json.dumps({"read_workers": 2}), encoding="utf-8")
+    server.poll()
+    assert not server.projects
+    assert project.retired and project.index is not None
+
+    # A new project on the same folder walks it while the old index is open.
+    assert "result" in request(server, "count_tokens", src=str(tmp_path / "one"))
+    (replacement,) = server.projects.values()
+    assert replacement.index is None
+
+    finish(resume, thread, responses)
+    assert project.index is None